@@ -1,18 +1,27 @@
-import numpy as np
-import streamlit as st
 import json
-from plotly import graph_objects as go
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, time
 from time import sleep
-from datetime import time
-import RPi.GPIO as GPIO
-from scipy.signal import savgol_filter
+
 import requests
+import streamlit as st
+from plotly import graph_objects as go
+
+import wire
+from smoothing import StreamingSavgol
+
+log = logging.getLogger(__name__)
 
 BACKEND_URL = "http://localhost:1111"
 
 MAX_TIME = 60  # n mins
 UPDATE_TIME = 1  # update every n seconds
 TICK_INTERVAL = 15  # in minutes
+SAMPLE_INTERVAL = 40  # seconds between the backend's logged samples, its update_time * log_interval
+MAX_POINTS = MAX_TIME * 60 // SAMPLE_INTERVAL + 1
 
 SETPOINT = 19.5
 SLIDER_MIN = 15.0
@@ -20,60 +29,105 @@ SLIDER_MAX = 23.0
 SLIDER_STEP = 0.5
 SLIDER_TICK_STEP = 1
 
-RELAY_PIN = 35
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BOARD)
-GPIO.setup(RELAY_PIN, GPIO.OUT)
-
-X = list(np.arange(0, int(MAX_TIME * 60) + 1, UPDATE_TIME))
-X_TICK_VALS = X[::-1][::int(TICK_INTERVAL * 60 / UPDATE_TIME)][::-1]
-X_TICK_TEXT = [f"{i // 60}:{i % 60:02}" for i in [(MAX_TIME - i // 60) for i in X_TICK_VALS]]
-X_TICK_TEXT[-1] = "now"
-
 
-def load_data():
-    # Load your data here, potentially from a changing source
-    data = json.load(open('data.json', 'r'))
-    temp_data = data['temp']
-    setpoint_data = data['setpoint']
-    return temp_data, setpoint_data
-
-
-def get_setpoint():
-    # use get request to get the setpoint from the backend
-    response = requests.get(f"{BACKEND_URL}/get_setpoint")
-    return response.json().get('setpoint', SETPOINT)
-
-
-def create_figure(temp_data, setpoint_data):
+@dataclass(frozen=True)
+class Snapshot:
+    """What every session draws, replaced whole on each change so sessions read it without a lock."""
+    time: list = field(default_factory=list)
+    temperature: list = field(default_factory=list)
+    smoothed: list = field(default_factory=list)
+    setpoint_history: list = field(default_factory=list)
+    setpoint: float = SETPOINT
+    heater_state: int = 0
+
+
+class HistoryFetcher:
+    """
+    Polls the backend from one thread for the whole process, however many sessions are open, and publishes a Snapshot
+    they all share. Only the samples logged since the last poll are fetched, with the history cursor, and only those
+    go through the smoother. Requests share one session so the connection to the backend is reused.
+    """
+
+    def __init__(self, url, interval, max_points):
+        self.url = url
+        self.interval = interval
+        self.max_points = max_points
+        self.http = requests.Session()
+        self.snapshot = Snapshot()
+        self._clear()
+        threading.Thread(target=self._run, name='history-fetcher', daemon=True).start()
+
+    def _clear(self):
+        self._cursor = 0
+        self._time = deque(maxlen=self.max_points)
+        self._temperature = deque(maxlen=self.max_points)
+        self._setpoint = deque(maxlen=self.max_points)
+        self._smoother = StreamingSavgol(window=15, order=3, capacity=self.max_points)
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except (requests.RequestException, ValueError, KeyError) as e:
+                # The backend restarting, keep what's shown and the cursor and try again
+                log.warning('Polling the backend failed: %s', e, extra={'event': 'poll_failed'})
+            sleep(self.interval)
+
+    def poll(self):
+        response = self.http.get(f'{self.url}/get_full_history', params={'since': self._cursor},
+                                 headers={'Accept': wire.MEDIA_TYPE}, timeout=2)
+        response.raise_for_status()
+        history = wire.decode(response.content)
+        setpoint = self.http.get(f'{self.url}/get_setpoint', timeout=2).json()['setpoint']
+        heater_state = self.http.get(f'{self.url}/get_heater_state', timeout=2).json()['heater_state']
+
+        if history['reset']:
+            # Samples were dropped before we saw them, start over from the window sent
+            self._clear()
+        self._cursor = history['cursor']
+        previous = self.snapshot
+        n = min(len(history['time']), self.max_points)
+        if not n and (setpoint, heater_state) == (previous.setpoint, previous.heater_state):
+            return
+        new = slice(len(history['time']) - n, None)
+        temperature = history['temperature'][new].astype(float).round(2).tolist()
+        self._time.extend(datetime.fromtimestamp(t) for t in history['time'][new].tolist())
+        self._temperature.extend(temperature)
+        self._setpoint.extend(history['setpoint'][new].astype(float).round(2).tolist())
+        # Only the new points go through the smoother, the rest of the smoothed series is kept
+        self._smoother.extend(temperature)
+        self.snapshot = Snapshot(list(self._time), list(self._temperature),
+                                 self._smoother.values(), list(self._setpoint), setpoint, heater_state)
+
+
+@st.cache_resource
+def get_fetcher():
+    return HistoryFetcher(BACKEND_URL, UPDATE_TIME, MAX_POINTS)
+
+
+def create_figure(snapshot):
     fig = go.Figure()
-    temp = temp_data[-1]
-    if len(temp_data) > 20:
-        temp_data = savgol_filter(temp_data, 15, 3)
-    n_points = len(temp_data)
-    _X = X[-n_points:]
     fig.add_trace(
-        go.Scatter(x=_X, y=temp_data, name='Temperature',
+        go.Scatter(x=snapshot.time, y=snapshot.smoothed, name='Temperature',
                    mode='lines',
                    line=dict(color='blue'))
     )
     fig.add_trace(
-        go.Scatter(x=_X, y=setpoint_data, name='Setpoint',
+        go.Scatter(x=snapshot.time, y=snapshot.setpoint_history, name='Setpoint',
                    line=dict(color='green'),
                    mode='lines')
     )
     fig.update_xaxes(
-        tickvals=X_TICK_VALS,
-        ticktext=X_TICK_TEXT,
+        tickformat='%H:%M',
+        dtick=TICK_INTERVAL * 60 * 1000,
         title_text='Time'
     )
 
-    is_on = GPIO.input(RELAY_PIN) == GPIO.HIGH
-    status = "ON" if is_on else "OFF"
+    temp = f'{snapshot.temperature[-1]:.2f}°C' if snapshot.temperature else '-'
+    status = "ON" if snapshot.heater_state else "OFF"
 
     fig.update_layout(
-        title=f"Set: {get_setpoint()}°C - Current: {temp:.2f}°C - STATUS: {status}",
+        title=f"Set: {snapshot.setpoint}°C - Current: {temp} - STATUS: {status}",
         xaxis_title='Time',
         yaxis_title='Temperature (°C)',
         legend=dict(
@@ -88,15 +142,10 @@ def create_figure(temp_data, setpoint_data):
     return fig
 
 
-def get_history():
-    req = requests.get(f"{BACKEND_URL}/get_history").json()
-    return req.get('temperature', [0]), req.get('setpoint', [0])
-
-
 # Initial load of the data
-temp_data, setpoint_data = get_history()
-fig = create_figure(temp_data, setpoint_data)
-chart = st.plotly_chart(fig, use_container_width=True)
+fetcher = get_fetcher()
+snapshot = fetcher.snapshot
+chart = st.plotly_chart(create_figure(snapshot), use_container_width=True)
 
 if 'setpoint' not in st.session_state:
     st.session_state.setpoint = SETPOINT
@@ -179,18 +228,9 @@ if st.sidebar.button("Load Schedule"):
         st.sidebar.error("No saved schedule found.")
 
 while True:
-    # Update the data
-    try:
-        temp_data, setpoint_data = get_history()
-    except json.decoder.JSONDecodeError:
-        sleep(1)
-        continue
-
-    # Update the figure
-    fig = create_figure(temp_data, setpoint_data)
-
-    # Update the chart in the app
-    chart.plotly_chart(fig, use_container_width=True)
+    # Redraw only when the fetcher has published something new
+    if fetcher.snapshot is not snapshot:
+        snapshot = fetcher.snapshot
+        chart.plotly_chart(create_figure(snapshot), use_container_width=True)
 
-    # Wait for 5 seconds before the next update
     sleep(UPDATE_TIME)
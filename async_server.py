@@ -0,0 +1,235 @@
+"""
+A small asyncio HTTP/1.1 server for the backend, used instead of the Werkzeug development server.
+
+One event loop owns every connection: keep-alive pollers and event streams cost a coroutine each rather than a thread.
+Requests are parsed with limits and timeouts so junk from scanners is cut off early. The Flask app still handles
+each request, in a small thread pool so a slow handler doesn't hold up the loop or the control ticks running on it.
+Event streams are served from the loop directly.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import unquote
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'PATCH'}
+
+
+class BadRequest(Exception):
+    def __init__(self, status, reason=''):
+        super().__init__(reason)
+        self.status = status
+
+
+class AsyncServer:
+    def __init__(self, app, streams=None, host='0.0.0.0', port=1111, workers=4, max_connections=256,
+                 header_timeout=10, body_timeout=10, keepalive_timeout=15, write_timeout=30, max_header_bytes=16384,
+                 max_body_bytes=1 << 20):
+        """
+        streams(path, query_string) returns an async generator of server-sent event messages for paths that should be
+        streamed, or None to pass the request on to the app. A HEAD request gets the headers and the generator closed
+        unstarted, so it shouldn't take anything it has to give back before its first message.
+        """
+        self.app = app
+        self.streams = streams
+        self.host = host
+        self.port = port
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.write_timeout = write_timeout
+        self.max_header_bytes = max_header_bytes
+        self.max_body_bytes = max_body_bytes
+        self.max_connections = max_connections
+        self.connections = 0
+        self.rejected = 0  # connections closed for malformed or oversized requests, timeouts or overload
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+
+    async def serve(self):
+        server = await asyncio.start_server(self._connection, self.host, self.port, limit=self.max_header_bytes)
+        async with server:
+            await server.serve_forever()
+
+    async def _connection(self, reader, writer):
+        if self.connections >= self.max_connections:
+            self.rejected += 1
+            writer.close()
+            return
+        self.connections += 1
+        try:
+            peer = writer.get_extra_info('peername') or ('', 0)
+            first = True
+            while True:
+                # The first request gets header_timeout, an idle keep-alive connection keepalive_timeout
+                timeout = self.header_timeout if first else self.keepalive_timeout
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    if first:
+                        self.rejected += 1
+                    return
+                except asyncio.LimitOverrunError:
+                    self.rejected += 1
+                    await self._error(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+                    return
+                first = False
+                try:
+                    method, target, version, headers = self._parse(head)
+                    body = await self._body(reader, headers)
+                except BadRequest as e:
+                    self.rejected += 1
+                    await self._error(writer, e.status)
+                    return
+
+                path, _, query = target.partition('?')
+                stream = self.streams(path, query) if self.streams and method in ('GET', 'HEAD') else None
+                if stream is not None:
+                    # Streams only subscribe once iterated, a HEAD gets the headers and the stream is never started
+                    await self._stream(writer, stream, body=method == 'GET')
+                    return
+                keep_alive = self._keep_alive(version, headers)
+                environ = self._environ(method, path, query, version, headers, body, peer)
+                status, response_headers, response_body = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._call_app, environ)
+                if method == 'HEAD':
+                    # The app leaves the body out of HEAD responses but says how long it would have been
+                    length = next((value for name, value in response_headers if name.lower() == 'content-length'), 0)
+                    await self._respond(writer, version, status, response_headers, b'', keep_alive, length)
+                else:
+                    await self._respond(writer, version, status, response_headers, response_body, keep_alive,
+                                        len(response_body))
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    @staticmethod
+    def _parse(head):
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise BadRequest(HTTPStatus.BAD_REQUEST) from None
+        if method not in METHODS or not target.startswith('/'):
+            raise BadRequest(HTTPStatus.BAD_REQUEST)
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise BadRequest(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                raise BadRequest(HTTPStatus.BAD_REQUEST)
+            headers.append((name.lower(), value.strip()))
+        return method, target, version, headers
+
+    async def _body(self, reader, headers):
+        headers = dict(headers)
+        if 'transfer-encoding' in headers:
+            # Nothing talking to a thermostat needs chunked uploads
+            raise BadRequest(HTTPStatus.LENGTH_REQUIRED)
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise BadRequest(HTTPStatus.BAD_REQUEST) from None
+        if length < 0:
+            raise BadRequest(HTTPStatus.BAD_REQUEST)
+        if length > self.max_body_bytes:
+            raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        if not length:
+            return b''
+        try:
+            return await asyncio.wait_for(reader.readexactly(length), self.body_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise BadRequest(HTTPStatus.REQUEST_TIMEOUT) from None
+
+    @staticmethod
+    def _keep_alive(version, headers):
+        connection = dict(headers).get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def _environ(self, method, path, query, version, headers, body, peer):
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            else:
+                key = f'HTTP_{key}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _call_app(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], body
+
+    async def _respond(self, writer, version, status, headers, body, keep_alive, content_length):
+        lines = [f'{version} {status}']
+        lines.extend(f'{name}: {value}' for name, value in headers if name.lower() not in ('content-length',
+                                                                                        'connection'))
+        lines.append(f'Content-Length: {content_length}')
+        lines.append(f'Connection: {"keep-alive" if keep_alive else "close"}')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _error(self, writer, status):
+        body = f'{status.value} {status.phrase}\n'.encode()
+        try:
+            await self._respond(writer, 'HTTP/1.1', f'{status.value} {status.phrase}',
+                                [('Content-Type', 'text/plain')], body, False, len(body))
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+
+    async def _stream(self, writer, stream, body=True):
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'X-Accel-Buffering: no\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'Connection: close\r\n\r\n')
+        if not body:
+            await stream.aclose()
+            await asyncio.wait_for(writer.drain(), self.write_timeout)
+            return
+        try:
+            async for message in stream:
+                writer.write(message.encode())
+                # A client that stops reading times out here, its queue fills meanwhile and it gets dropped
+                await asyncio.wait_for(writer.drain(), self.write_timeout)
+        finally:
+            await stream.aclose()
@@ -1,8 +1,25 @@
-import argparse
+from time import perf_counter
 
-from hysteresis import HysteresisController
+started = perf_counter()
 
-from flask import Flask, jsonify, request
+import argparse
+import asyncio
+import logging
+from urllib.parse import unquote
+
+from async_server import AsyncServer
+from duty import PERIODS
+from events import format_event
+from hardware import RELAYS, SENSORS, make_sensor
+import logs
+from metrics import CONTENT_TYPE, HTTP_BUCKETS, Histogram, Registry
+from response_cache import ResponseCache
+import wire
+from ticker import Ticker
+from zones import CONTROLLERS, Zones
+
+import numpy as np
+from flask import Blueprint, Flask, Response, abort, g, jsonify, request
 from flask_cors import CORS
 import threading
 from datetime import time
@@ -14,69 +31,358 @@ args = argparse.ArgumentParser()
 args.add_argument('--default_setpoint', type=float, default=19.5)
 args.add_argument('--timespan', type=int, default=60 * 24)
 args.add_argument('--update_time', type=int, default=2)
+args.add_argument('--controller', choices=sorted(CONTROLLERS), default='hysteresis')
 args.add_argument('--hysteresis', type=float, default=0.25)
+args.add_argument('--kp', type=float, default=1.0, help='PID proportional gain, duty cycle per °C')
+args.add_argument('--ki', type=float, default=1 / 1800, help='PID integral gain, per °C second')
+args.add_argument('--kd', type=float, default=60, help='PID derivative gain, per °C/s')
+args.add_argument('--window', type=int, default=15 * 60, help='PID time proportioning window in seconds')
+args.add_argument('--min_on', type=int, default=120, help='shortest PID heater run in seconds')
+args.add_argument('--min_off', type=int, default=120, help='shortest PID heater pause in seconds')
 args.add_argument('--relay_pin', type=int, default=35)
-args.add_argument('--data_file', type=str, default='data.json')
+args.add_argument('--data_file', type=str, default='history.dat')
+args.add_argument('--journal_file', type=str, default='transitions.dat', help='where relay transitions are recorded')
 args.add_argument('--config_file', type=str, default='config.json')
 args.add_argument('--supress_gpio_warnings', type=bool, default=True)
+args.add_argument('--sensor', choices=sorted(SENSORS), default='tmp75')
+args.add_argument('--relay', choices=sorted(RELAYS), default='gpio', help='none runs without switching anything')
+args.add_argument('--missed_ticks', choices=Ticker.POLICIES, default='skip',
+                  help='what to do with control ticks missed because the previous one overran')
+args.add_argument('--resolution', type=int, choices=(9, 10, 11, 12), default=12, help='TMP75 resolution in bits')
+args.add_argument('--one_shot', action='store_true', help='keep the TMP75 shut down between reads')
+args.add_argument('--oversample', type=int, default=1, help='samples per read, the median is kept')
+args.add_argument('--smoothing', choices=('median', 'ema'), default=None)
+args.add_argument('--max_jump', type=float, default=None, help='°C change between reads treated as an outlier')
+args.add_argument('--preheat', action='store_true',
+                  help='learn how fast the room warms up and start heating early to reach scheduled raises on time')
+args.add_argument('--max_preheat', type=int, default=3 * 60, help='longest head start for a scheduled raise, in minutes')
+args.add_argument('--zones', type=str, default=None,
+                  help='JSON file describing several zones to run, instead of the single one set up by the other flags')
+args.add_argument('--server', choices=('asyncio', 'flask'), default='asyncio',
+                  help='asyncio serves everything from one event loop, flask is the Werkzeug development server')
+args.add_argument('--host', type=str, default='0.0.0.0')
+args.add_argument('--port', type=int, default=1111)
+args.add_argument('--log_file', type=str, default='backend.log',
+                  help='JSON lines log, rotated at 1 MB with 5 old files kept')
+args.add_argument('--log_level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'), default='INFO')
 
 args = args.parse_args()
+imported = perf_counter()
+
+log_ring = logs.setup(args.log_file, level=args.log_level)
+log = logging.getLogger('backend')
+
+sensor_options = {'resolution': args.resolution, 'one_shot': args.one_shot}
+if args.oversample > 1 or args.smoothing or args.max_jump is not None:
+    sensor_options['filter'] = {'oversample': args.oversample, 'smoothing': args.smoothing, 'max_jump': args.max_jump}
+
+# Arguments only the named controller takes
+CONTROLLER_OPTIONS = {
+    'hysteresis': ('hysteresis',),
+    'pid': ('kp', 'ki', 'kd', 'window', 'min_on', 'min_off'),
+}
+
+# Global instances
+if args.zones is None:
+    controller_args = vars(args).copy()
+    for key in ('zones', 'server', 'host', 'port', 'resolution', 'one_shot', 'oversample', 'smoothing', 'max_jump',
+                'log_file', 'log_level', 'controller'):
+        controller_args.pop(key)
+    for name, options in CONTROLLER_OPTIONS.items():
+        if name != args.controller:
+            for key in options:
+                controller_args.pop(key)
+    controller_args['sensor'] = make_sensor(args.sensor, **sensor_options)
+    zones = Zones({'default': CONTROLLERS[args.controller](**controller_args)}, update_time=args.update_time,
+                  missed_ticks=args.missed_ticks)
+else:
+    zones = Zones.from_file(args.zones, default_setpoint=args.default_setpoint, timespan=args.timespan,
+                            update_time=args.update_time, supress_gpio_warnings=args.supress_gpio_warnings,
+                            sensor=args.sensor, sensor_options=sensor_options, relay=args.relay,
+                            missed_ticks=args.missed_ticks, preheat=args.preheat, max_preheat=args.max_preheat)
+# The default zone, which the routes without a /zones/<id> prefix act on
+controller = zones[zones.default]
+log.info('Startup: imports %.2fs, %d zone(s) %.2fs', imported - started, len(zones), perf_counter() - imported,
+         extra={'event': 'startup'})
+
+responses = ResponseCache()
+registry = Registry()
+zones.register_metrics(registry)
+registry.counter('thermos_response_cache_hits_total', 'Responses served from the serialized response cache.',
+                 lambda: [({}, responses.hits)])
+registry.counter('thermos_response_cache_misses_total', 'Responses that had to be serialized.',
+                 lambda: [({}, responses.misses)])
+# (route, method) -> Histogram, a handful of entries created on the first request to each route
+http_seconds = {}
+http_seconds_lock = threading.Lock()
+registry.histogram('thermos_http_request_duration_seconds', 'Time taken to handle an HTTP request, by route.',
+                   lambda: [({'route': route, 'method': method}, histogram)
+                            for (route, method), histogram in list(http_seconds.items())])
+
+
+@app.before_request
+def start_timer():
+    g.started = perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    if 'started' in g:
+        key = (request.url_rule.rule if request.url_rule is not None else 'unmatched', request.method)
+        histogram = http_seconds.get(key)
+        if histogram is None:
+            with http_seconds_lock:
+                histogram = http_seconds.setdefault(key, Histogram(HTTP_BUCKETS))
+        histogram.observe(perf_counter() - g.started)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+# Every per zone route is served at /zones/<zone_id>/... and, for the default zone, at the top level
+zone_api = Blueprint('zone', __name__)
+
+
+@zone_api.url_value_preprocessor
+def select_zone(endpoint, values):
+    zone = values.pop('zone_id', zones.default) if values else zones.default
+    if zone not in zones:
+        abort(404, description=f'Unknown zone {zone!r}')
+    g.zone = zone
+    g.controller = zones[zone]
+
+
+def wants_packed():
+    """Whether the client asked for the packed column format (see wire.py) over JSON."""
+    return request.accept_mimetypes.best_match(['application/json', wire.MEDIA_TYPE]) == wire.MEDIA_TYPE
+
+
+def negotiated(body, mimetype):
+    response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+
+def cached_json(version, render, render_packed=None):
+    """
+    A JSON response for this zone, route and query string, served from the response cache while version stays the same.
+    It carries a strong ETag and becomes an empty 304 when the client's If-None-Match already has it. With
+    render_packed the client can ask for the packed format instead.
+    """
+    packed = render_packed is not None and wants_packed()
+    # By route name without the blueprint, the prefixed and unprefixed routes of the default zone share entries
+    key = (g.zone, request.endpoint.rsplit('.', 1)[-1], request.query_string, packed)
+    if packed:
+        body, etag = responses.get(key, version, render_packed)
+        response = negotiated(body, wire.MEDIA_TYPE)
+    else:
+        body, etag = responses.get(key, version, lambda: app.json.dumps(render()).encode())
+        response = negotiated(body, 'application/json') if render_packed is not None else \
+            Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def history_response(with_time):
+    """
+    Without arguments the whole window is returned. With ?since=<cursor> only the samples logged after that cursor are
+    returned, along with the cursor to use next. If the cursor has already fallen off the buffer the whole window is
+    sent with reset set, and the client should replace what it has instead of appending.
+
+    In the packed format times are epoch seconds rather than dates.
+    """
+    return cached_json(g.controller.history_version,
+                       lambda: g.controller.read_history(history_payload, with_time),
+                       lambda: g.controller.read_history(history_packed, with_time))
 
-# Global instance
-controller = HysteresisController(**vars(args))
 
+def history_window():
+    since = request.args.get('since', type=int)
+    if since is None:
+        return g.controller.get_history_snapshot(), {}
+    snapshot, cursor, reset = g.controller.get_history_since(since)
+    return snapshot, {'cursor': cursor, 'reset': reset, 'capacity': g.controller.history.capacity}
 
-@app.route('/get_history', methods=['GET'])
+
+def history_payload(with_time):
+    snapshot, response = history_window()
+    response['temperature'] = g.controller.get_temperature_history(snapshot)
+    response['setpoint'] = g.controller.get_setpoint_history(snapshot)
+    if with_time:
+        response['time'] = g.controller.get_time_history(snapshot)
+    return response
+
+
+def history_packed(with_time):
+    snapshot, meta = history_window()
+    columns = [('temperature', wire.FLOAT32, snapshot.temperature), ('setpoint', wire.FLOAT32, snapshot.setpoint)]
+    if with_time:
+        columns.append(('time', wire.TIME, snapshot.time))
+    return wire.encode(columns, meta)
+
+
+@zone_api.route('/get_history', methods=['GET'])
 def get_history():
-    return jsonify({
-        'temperature': controller.get_temperature_history(),
-        'setpoint': controller.get_setpoint_history(),
-    })
+    return history_response(with_time=False)
 
 
-@app.route('/get_full_history', methods=['GET'])
+@zone_api.route('/get_full_history', methods=['GET'])
 def get_full_history():
-    return jsonify({
-        'temperature': controller.get_temperature_history(),
-        'setpoint': controller.get_setpoint_history(),
-        'time': controller.get_time_history()
-    })
+    """
+    With any of ?start=&end=&max_points= this returns a downsampled range instead: start and end are epoch seconds
+    (defaulting to the last day), times come back as epoch seconds, and besides the mean temperature and setpoint
+    each point carries min, max and the heater duty cycle. resolution is the bucket width in seconds, or null for
+    raw samples.
+    """
+    if not {'start', 'end', 'max_points'} & request.args.keys():
+        return history_response(with_time=True)
+
+    end = request.args.get('end', default=g.controller.clock.time(), type=float)
+    start = request.args.get('start', default=end - 24 * 60 * 60, type=float)
+    max_points = max(3, request.args.get('max_points', default=500, type=int))
+    if wants_packed():
+        return negotiated(g.controller.read_history(history_range_packed, start, end, max_points), wire.MEDIA_TYPE)
+    return negotiated(g.controller.read_history(history_range_json, start, end, max_points), 'application/json')
+
 
+def history_range_packed(start, end, max_points):
+    series, resolution = g.controller.query_history(start, end, max_points)
+    return wire.encode([
+        ('time', wire.TIME, series.time),
+        ('temperature', wire.FLOAT32, series.temperature),
+        ('min', wire.FLOAT32, series.minimum),
+        ('max', wire.FLOAT32, series.maximum),
+        ('setpoint', wire.FLOAT32, series.setpoint),
+        ('duty', wire.FLOAT32, series.duty),
+    ], {'resolution': resolution})
 
-@app.route('/get_setpoint', methods=['GET'])
+
+def history_range_json(start, end, max_points):
+    series, resolution = g.controller.query_history(start, end, max_points)
+    response = series.to_dict()
+    response['resolution'] = resolution
+    return app.json.dumps(response)
+
+
+@zone_api.route('/get_setpoint', methods=['GET'])
 def get_setpoint():
-    return jsonify({'setpoint': controller.setpoint})
+    return jsonify({'setpoint': g.controller.setpoint})
 
 
-@app.route('/get_heater_state', methods=['GET'])
+@zone_api.route('/get_heater_state', methods=['GET'])
 def get_heater_state():
-    return jsonify({'heater_state': controller.heater_state()})
+    return jsonify({'heater_state': g.controller.heater_state()})
+
+
+@zone_api.route('/get_duty_cycle', methods=['GET'])
+def get_duty_cycle():
+    """
+    Heater on time, duty cycle, cycles and mean run and cycle lengths for the current ?period=hour|day (default day),
+    or the last ?count= of them, newest first. Kept up to date on every relay transition, nothing is recomputed here.
+    """
+    period = request.args.get('period', default='day')
+    if period not in PERIODS:
+        abort(400, f'period must be one of {", ".join(PERIODS)}')
+    count = min(max(1, request.args.get('count', default=1, type=int)), PERIODS[period][1])
+    return jsonify({'period': period, 'heater_state': g.controller.heater_state(),
+                    'buckets': g.controller.get_duty_cycle(period, count)})
+
+
+@zone_api.route('/get_preheat', methods=['GET'])
+def get_preheat():
+    """The learned warming and cooling rates in °C per hour and, when one is planned, when preheating will start."""
+    return jsonify(g.controller.get_preheat())
+
+
+@zone_api.route('/get_controller', methods=['GET'])
+def get_controller():
+    """The controller's type, parameters and, for PID, its current terms and output, for tuning."""
+    return jsonify(g.controller.get_terms())
+
+
+@zone_api.route('/get_loop_stats', methods=['GET'])
+def get_loop_stats():
+    return jsonify(g.controller.get_loop_stats())
 
 
-@app.route('/set_setpoint', methods=['POST'])
+@zone_api.route('/set_setpoint', methods=['POST'])
 def set_setpoint():
-    setpoint = request.json.get('setpoint')
-    controller.update_setpoint(setpoint=setpoint)
+    setpoint = (request.get_json(silent=True) or {}).get('setpoint')
+    try:
+        g.controller.update_setpoint(setpoint=setpoint)
+    except ValueError as e:
+        abort(400, str(e))
     return jsonify({'status': 'success'})
 
 
-@app.route('/get_temperature', methods=['GET'])
+@zone_api.route('/get_temperature', methods=['GET'])
 def get_temperature():
-    return jsonify({'temperature': controller.read_temp()})
+    return jsonify(g.controller.get_reading())
 
 
-@app.route('/get_schedule', methods=['GET'])
+@zone_api.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-sent events: a 'state' event on connect, then 'reading' every control tick, 'sample' when a point is logged,
+    'heater' on relay transitions and 'setpoint'/'schedule'/'schedule_state' when those change.
+    """
+    controller = g.controller
+    return Response(controller.events.stream(lambda: format_event('state', controller.get_state())),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@zone_api.route('/get_schedule', methods=['GET'])
 def get_schedule():
-    return jsonify(controller.schedule.to_dict())
+    # One state, so the version and the schedule cached under it match
+    state = g.controller.state
+    return cached_json(state.schedule_version, state.schedule.to_dict)
+
+
+@zone_api.route('/get_next_transition', methods=['GET'])
+def get_next_transition():
+    transition, when = g.controller.next_transition()
+    if transition is None:
+        return jsonify({'time': None, 'setpoint': None, 'name': None})
+    return jsonify({'time': when.isoformat(), 'setpoint': transition.setpoint, 'name': transition.name})
+
+
+@zone_api.route('/get_schedule_setpoints', methods=['GET'])
+def get_schedule_setpoints():
+    """Scheduled setpoint at `points` evenly spaced times between ?start= and ?end= (epoch seconds), for overlays."""
+    end = request.args.get('end', default=g.controller.clock.time(), type=float)
+    start = request.args.get('start', default=end - 24 * 60 * 60, type=float)
+    points = min(max(2, request.args.get('points', default=500, type=int)), 10000)
+    timestamps = np.linspace(start, end, points)
+    return jsonify({
+        'time': timestamps.tolist(),
+        'setpoint': g.controller.compiled_schedule.setpoints_at(timestamps).tolist(),
+    })
 
 
 @app.route('/get_logs', methods=['GET'])
 def get_logs():
-    with open('backend.log', 'r') as f:
-        return jsonify(f.read())
-
-
-@app.route('/set_schedule', methods=['POST'])
+    """
+    The most recent log entries, oldest first, from memory. ?after=<cursor> returns only those logged after that
+    cursor, ?limit= caps how many come back (default 100, at most 1000) and ?level= drops the ones below it. Pass the
+    returned cursor as after next time to tail the log. reset means entries after `after` were already dropped.
+    """
+    after = request.args.get('after', type=int)
+    limit = min(max(1, request.args.get('limit', default=100, type=int)), 1000)
+    level = request.args.get('level', default='DEBUG').upper()
+    if not isinstance(logging.getLevelName(level), int):
+        abort(400, f'Unknown level {level}')
+    if after is None:
+        # Without a cursor, the last `limit` entries
+        after = max(0, log_ring.last_offset - limit)
+    entries, cursor, reset = log_ring.since(after, limit, logging.getLevelName(level))
+    return jsonify({'entries': entries, 'cursor': cursor, 'reset': reset})
+
+
+@zone_api.route('/set_schedule', methods=['POST'])
 def set_schedule():
     """
     Spec for how the schedule will get generated and sent to the backend
@@ -90,32 +396,75 @@ def set_schedule():
     wakeup_temperature=data['wakeup_temperature'],
     at_work_temperature=data['at_work_temperature']
     """
-    schedule = request.json.get('schedule')
-    controller.set_schedule(schedule)
+    schedule = (request.get_json(silent=True) or {}).get('schedule')
+    try:
+        g.controller.set_schedule(schedule)
+    except ValueError as e:
+        abort(400, str(e))
     return jsonify({'status': 'success'})
 
 
 # toggle schedule
-@app.route('/toggle_schedule', methods=['POST'])
+@zone_api.route('/toggle_schedule', methods=['POST'])
 def toggle_schedule():
     state = request.json.get('state')
-    controller.toggle_schedule(state)
+    g.controller.toggle_schedule(state)
     return jsonify({'status': 'success'})
 
 
 # get schedule state
-@app.route('/get_schedule_state', methods=['GET'])
+@zone_api.route('/get_schedule_state', methods=['GET'])
 def get_schedule_state():
-    return jsonify({'state': controller.get_schedule_state()})
+    return jsonify({'state': g.controller.get_schedule_state()})
+
+
+@app.route('/zones', methods=['GET'])
+def get_zones():
+    """Every zone's current state in one response, keyed by zone id."""
+    return jsonify(zones.get_state())
+
+
+app.register_blueprint(zone_api)
+app.register_blueprint(zone_api, url_prefix='/zones/<zone_id>', name='zones')
+
+
+def event_stream(path, query):
+    """The /stream routes for the asyncio server, which streams them from its event loop instead of a thread each."""
+    parts = path.split('/')
+    if path == '/stream':
+        zone = zones.default
+    elif len(parts) == 4 and parts[1] == 'zones' and parts[3] == 'stream':
+        zone = unquote(parts[2])
+    else:
+        return None
+    if zone not in zones:
+        # Let the app answer with its 404
+        return None
+    controller = zones[zone]
+    return controller.events.stream_async(lambda: format_event('state', controller.get_state()))
 
 
 def run_controller():
-    controller.control_loop()
+    zones.control_loop()
 
 
-if __name__ == '__main__':
-    thread = threading.Thread(target=run_controller)
-    thread.daemon = True
-    thread.start()
+async def serve(server):
+    # If either stops, so does the process, rather than serving a thermostat that's no longer controlling anything
+    await asyncio.gather(zones.control_task(), server.serve())
+
 
-    app.run(host='0.0.0.0', port=1111)
+if __name__ == '__main__':
+    if args.server == 'asyncio':
+        server = AsyncServer(app, streams=event_stream, host=args.host, port=args.port)
+        registry.gauge('thermos_http_connections', 'Open HTTP connections.', lambda: [({}, server.connections)])
+        registry.counter('thermos_http_rejected_total', 'Connections closed for bad requests, timeouts or overload.',
+                         lambda: [({}, server.rejected)])
+        log.info('Serving after %.2fs', perf_counter() - started, extra={'event': 'startup'})
+        asyncio.run(serve(server))
+    else:
+        thread = threading.Thread(target=run_controller)
+        thread.daemon = True
+        thread.start()
+
+        log.info('Serving after %.2fs', perf_counter() - started, extra={'event': 'startup'})
+        app.run(host=args.host, port=args.port)
@@ -0,0 +1,44 @@
+"""
+Stand-ins for smbus and RPi.GPIO so the benchmarks run on any Linux box. install() registers them as those modules,
+even where the real ones exist, so timings don't depend on the hardware. Only the calls the backend makes are
+implemented, doing as little as possible.
+"""
+import sys
+import types
+
+
+class FakeSMBus:
+    def __init__(self, channel=1, temperature=19.5):
+        self.registers = {}
+        raw = int(temperature / 0.0625) & 0xFFF
+        self.temperature_bytes = [raw >> 4, (raw & 0xF) << 4]
+
+    def read_i2c_block_data(self, address, register, length):
+        if register == 0:
+            return list(self.temperature_bytes)
+        return list(self.registers.get((address, register), [0] * length))[:length]
+
+    def write_i2c_block_data(self, address, register, data):
+        self.registers[(address, register)] = list(data)
+
+
+def _gpio_module():
+    gpio = types.ModuleType('RPi.GPIO')
+    gpio.BOARD, gpio.OUT, gpio.HIGH, gpio.LOW = 10, 0, 1, 0
+    pins = {}
+    gpio.setwarnings = lambda flag: None
+    gpio.setmode = lambda mode: None
+    gpio.setup = lambda pin, mode: pins.setdefault(pin, 0)
+    gpio.output = lambda pin, state: pins.__setitem__(pin, int(state))
+    gpio.input = lambda pin: pins.get(pin, 0)
+    return gpio
+
+
+def install():
+    smbus = types.ModuleType('smbus')
+    smbus.SMBus = FakeSMBus
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = _gpio_module()
+    sys.modules['smbus'] = smbus
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = rpi.GPIO
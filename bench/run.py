@@ -0,0 +1,175 @@
+"""
+Micro-benchmarks of the backend's hot paths against fake hardware.
+
+    python bench/run.py            # run and print the timings
+    python bench/run.py --check    # also compare against bench/baseline.json, exit 1 on a regression
+    python bench/run.py --update   # run and store the timings as the new baseline
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes  # noqa: E402
+
+fakes.install()
+
+from controller import TemperatureSchedule  # noqa: E402
+from hysteresis import HysteresisController  # noqa: E402
+from on_off_controller import OnOffController  # noqa: E402
+from tmp75 import TMP75  # noqa: E402
+import wire  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def make_controller(cls, **kwargs):
+    return cls(sensor=TMP75(bus=fakes.FakeSMBus()), relay='gpio', config_file=None, data_file=None, **kwargs)
+
+
+def toggling(controller):
+    """control_step with the temperature alternating either side of the setpoint, so every call switches the relay."""
+    temperatures = [18.0, 21.0]
+    state = [0]
+
+    def run():
+        state[0] ^= 1
+        controller.control_step(temp=temperatures[state[0]], setpoint=19.5)
+
+    return run
+
+
+def full_history_client():
+    """The real backend app with a full day of history, 2161 points at the default settings."""
+    directory = tempfile.mkdtemp()
+    argv = sys.argv
+    sys.argv = ['backend.py', '--data_file', os.path.join(directory, 'history.dat'), '--config_file',
+                os.path.join(directory, 'config.json'), '--log_file', os.path.join(directory, 'backend.log')]
+    try:
+        import backend
+    finally:
+        sys.argv = argv
+    controller = backend.controller
+    now = controller.clock.time()
+    for i in range(controller.history.capacity):
+        controller.history.append(19.5 + (i % 16) * 0.0625, 19.5, now + i * 40, i % 2)
+    assert len(controller.history) == 2161, len(controller.history)
+    return backend.app.test_client(), controller
+
+
+def benchmarks():
+    sensor = TMP75(bus=fakes.FakeSMBus())
+    hysteresis = make_controller(HysteresisController)
+    onoff = make_controller(OnOffController)
+
+    scheduled = make_controller(HysteresisController)
+    monday_morning = datetime(2024, 1, 1, 7, 30)
+
+    def schedule_lookup():
+        # What tick() does when a transition may be due, the setpoint is left as it was so each run repeats it
+        scheduled._next_schedule_check = 0
+        scheduled._applied_transition = None
+        scheduled.apply_schedule(monday_morning)
+
+    # Nothing samples its sensor in the background, so its one reading never expires and tick() times control rather
+    # than the stale reading fail-safe
+    ticking = make_controller(HysteresisController, max_staleness=math.inf)
+    schedule = TemperatureSchedule(events=[{'days': [5], 'time': '12:00', 'temperature': 18.0, 'name': 'Lunch'}])
+    schedule_dict = schedule.to_dict()
+
+    def from_dict():
+        TemperatureSchedule().from_dict(schedule_dict)
+
+    client, history_controller = full_history_client()
+
+    def full_history():
+        # A new version every time, so the response is built and serialized rather than served from the cache
+        history_controller.history_version += 1
+        return client.get('/get_full_history')
+
+    def full_history_packed():
+        history_controller.history_version += 1
+        return client.get('/get_full_history', headers={'Accept': wire.MEDIA_TYPE})
+
+    return {
+        'twos_comp': lambda: TMP75.twos_comp(0xF90, 12),
+        'tmp75_read_temp': sensor.read_temp,
+        'hysteresis_control_step': toggling(hysteresis),
+        'onoff_control_step': toggling(onoff),
+        'schedule_lookup': schedule_lookup,
+        'tick': ticking.tick,
+        'schedule_to_dict': schedule.to_dict,
+        'schedule_from_dict': from_dict,
+        'full_history_response': full_history,
+        'full_history_cached': lambda: client.get('/get_full_history'),
+        'full_history_packed': full_history_packed,
+    }
+
+
+def measure(function, repeat=7):
+    """Best of `repeat` runs of seconds per call, each run long enough to be timed reliably."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument('--check', action='store_true', help='fail if anything is slower than the baseline')
+    args.add_argument('--update', action='store_true', help='store these timings as the baseline')
+    args.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown, as a fraction of the baseline')
+    args.add_argument('--retries', type=int, default=3, help='times to measure again what looks like a regression')
+    args.add_argument('--only', nargs='*', default=None, help='names of the benchmarks to run')
+    args = args.parse_args()
+
+    baseline = json.load(open(BASELINE)) if os.path.exists(BASELINE) else {'results': {}}
+    results = {}
+    regressions = []
+    # The controllers log as they go, that is timed but console output isn't shown
+    devnull = open(os.devnull, 'w')
+    with contextlib.redirect_stdout(devnull):
+        functions = benchmarks()
+    for name, function in functions.items():
+        if args.only and name not in args.only:
+            continue
+        with contextlib.redirect_stdout(devnull):
+            results[name] = measure(function)
+        reference = baseline['results'].get(name)
+        for _ in range(args.retries):
+            if not reference or results[name] / reference - 1 <= args.tolerance:
+                break
+            # Timings on a shared or throttled machine swing by 2x between runs, measure again before calling it a
+            # regression
+            with contextlib.redirect_stdout(devnull):
+                results[name] = min(results[name], measure(function))
+        line = f'{name:<26} {results[name] * 1e6:>10.2f} us'
+        if reference:
+            change = results[name] / reference - 1
+            line += f'  {change:+7.1%} vs baseline'
+            if change > args.tolerance:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    if args.update:
+        json.dump({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': {**baseline['results'], **results},
+        }, open(BASELINE, 'w'), indent=2)
+        print(f'Baseline written to {BASELINE}')
+    if args.check and regressions:
+        print(f'{len(regressions)} regression(s) over {args.tolerance:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
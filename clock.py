@@ -0,0 +1,22 @@
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    """Wall clock time. The controller takes its time from a clock object so the simulator can swap in virtual time."""
+
+    @staticmethod
+    def time():
+        return time.time()
+
+    @staticmethod
+    def monotonic():
+        return time.monotonic()
+
+    @staticmethod
+    def now():
+        return datetime.now()
+
+    @staticmethod
+    def sleep(seconds):
+        time.sleep(seconds)
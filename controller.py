@@ -1,16 +1,64 @@
 import json
+import logging
+import math
+import numbers
+import threading
 from abc import ABC, abstractmethod
-from collections import deque
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, replace
 from datetime import time, datetime
-from time import sleep
 from typing import Union
 
-import RPi.GPIO as GPIO
-
-from tmp75 import TMP75
+from clock import SystemClock
+from duty import DutyCycle, RelayJournal
+from events import EventBroadcaster
+from hardware import Relay, Sensor, make_relay, make_sensor
+from preheat import RateEstimator
+from ringbuffer import HistoryBuffer
+from rollups import Rollups, Series
+from sampler import SensorSampler
+from schedule import DAY, Transition, WeeklySchedule
+from store import SampleStore
+from ticker import Ticker
+from writer import BackgroundWriter
 import warnings
 
+log = logging.getLogger(__name__)
+
+# Setpoints outside this range are refused, in °C
+MIN_SETPOINT = 10
+MAX_SETPOINT = 25
+
+
+def _temperature(value, what):
+    """value as a float, raises ValueError unless it's a number between MIN_SETPOINT and MAX_SETPOINT."""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        temperature = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{what} must be a number, got {value!r}') from None
+    if not MIN_SETPOINT <= temperature <= MAX_SETPOINT:
+        raise ValueError(f'{what} must be between {MIN_SETPOINT} and {MAX_SETPOINT}°C, got {value!r}')
+    return temperature
+
+
+def _event(event):
+    """A checked copy of a schedule event, raises ValueError if it can't be compiled."""
+    if not isinstance(event, dict):
+        raise ValueError(f'Schedule events must be objects, got {event!r}')
+    if 'time' not in event or 'temperature' not in event:
+        raise ValueError(f'Schedule events need a time and a temperature, got {event!r}')
+    if not isinstance(event['time'], str):
+        raise ValueError(f'Event time must be an ISO time string, got {event["time"]!r}')
+    time.fromisoformat(event['time'])
+    checked = dict(event, temperature=_temperature(event['temperature'], 'Event temperature'))
+    if 'days' in event:
+        days = event['days']
+        if not isinstance(days, list) or \
+                not all(isinstance(day, int) and not isinstance(day, bool) and 0 <= day <= 6 for day in days):
+            raise ValueError(f'Event days must be a list of weekdays 0 (Monday) to 6, got {days!r}')
+    return checked
+
 
 @dataclass
 class TemperatureSchedule:
@@ -29,6 +77,10 @@ class TemperatureSchedule:
     wakeup_temperature: float = 20.0  # Default wakeup temperature
     at_work_temperature: float = 16.0  # Default at work temperature
 
+    # Any number of extra transitions on top of the named ones above, each a dict like
+    # {'days': [0, 1, 2, 3, 4], 'time': '12:00', 'temperature': 19.0, 'name': 'Lunch'} with Monday as day 0
+    events: list = field(default_factory=list)
+
     def to_dict(self):
         d = asdict(self)
         for key in d:
@@ -36,7 +88,29 @@ class TemperatureSchedule:
                 d[key] = d[key].isoformat()
         return d
 
+    def transitions(self):
+        for day in range(5):
+            yield Transition(day * DAY + _seconds(self.weekday_wakeup_time), self.wakeup_temperature, 'Waking up')
+            yield Transition(day * DAY + _seconds(self.leave_for_work_time), self.at_work_temperature,
+                             'Leaving for work')
+            # Assuming you want to return to the wakeup temperature
+            yield Transition(day * DAY + _seconds(self.home_from_work_time), self.wakeup_temperature, 'Home from work')
+            yield Transition(day * DAY + _seconds(self.weekday_bedtime), self.bedtime_temperature, 'Bedtime')
+        for day in range(5, 7):
+            yield Transition(day * DAY + _seconds(self.weekend_wakeup_time), self.wakeup_temperature, 'Waking up')
+            yield Transition(day * DAY + _seconds(self.weekend_bedtime), self.bedtime_temperature, 'Bedtime')
+        for event in self.events:
+            at = _seconds(time.fromisoformat(event['time']))
+            for day in event.get('days', range(7)):
+                yield Transition(day * DAY + at, float(event['temperature']), event.get('name', 'Scheduled event'))
+
+    def compile(self):
+        return WeeklySchedule(self.transitions())
+
     def from_dict(self, data: dict[str, Union[float, str]]):
+        """Raises ValueError for a time that doesn't parse, a temperature out of range or a malformed event."""
+        if not isinstance(data, dict):
+            raise ValueError(f'A schedule must be an object, got {data!r}')
         for k, v in data.items():
             if not hasattr(self, k):
                 warnings.warn(f'Invalid key: {k}, skipping.')
@@ -44,16 +118,39 @@ class TemperatureSchedule:
 
             if isinstance(v, str) and 'temperature' not in k:
                 setattr(self, k, time.fromisoformat(v))
-            elif isinstance(v, (float, int)) and 'temperature' in k:
-                setattr(self, k, v)
-            elif isinstance(v, str) and 'temperature' in k:
-                setattr(self, k, float(v))
+            elif isinstance(v, (float, int, str)) and 'temperature' in k:
+                setattr(self, k, _temperature(v, k))
+            elif k == 'events':
+                if not isinstance(v, list):
+                    raise ValueError(f'events must be a list, got {v!r}')
+                setattr(self, k, [_event(event) for event in v])
+
+
+def _seconds(t: time):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+@dataclass(frozen=True)
+class ControllerState:
+    """
+    The settings that change from outside the control loop. A state is never modified, changes publish a new one, so
+    whoever holds one sees a setpoint and schedule that belong together without taking a lock.
+    """
+    setpoint: float
+    schedule: TemperatureSchedule  # not modified once published either
+    compiled_schedule: WeeklySchedule
+    schedule_enabled: bool = True
+    version: int = 0  # bumped on every change
+    schedule_version: int = 0  # bumped when the schedule or whether it's enabled changes
 
 
 class TemperatureController(ABC):
     """
     Base class for a temperature controller that reads the temperature from a TMP75 sensor and controls a relay
     connected to a heating element in an attempt to maintain a setpoint temperature.
+
+    The sensor and relay are hardware drivers (see hardware.py), picked by name or passed in as objects, and the clock
+    defaults to wall clock time. simulation.py swaps all three out.
     """
 
     def __init__(
@@ -64,62 +161,355 @@ class TemperatureController(ABC):
             timespan=60 * 24,  # in minutes
             log_interval=20,
             config_file='config.json',
-            data_file='data.json',
+            data_file=None,
+            journal_file=None,  # relay transitions, see RelayJournal
             supress_gpio_warnings=True,
-            schedule: TemperatureSchedule = TemperatureSchedule()
-
+            max_staleness=10,  # in seconds
+            missed_ticks='skip',  # see Ticker
+            preheat=False,  # start heating early for scheduled raises, from the learned warm up rate
+            max_preheat=3 * 60,  # in minutes
+            schedule: TemperatureSchedule = TemperatureSchedule(),
+            sensor: Union[str, Sensor] = 'tmp75',
+            relay: Union[str, Relay] = 'gpio',
+            clock=None,
     ):
-        self.tmp75 = TMP75()
-        print(f'Initialized TMP75 sensor: {self.tmp75.read_temp()}°C')
+        # Drivers can be given by name (see hardware.py) or as ready made objects
+        if isinstance(sensor, str):
+            sensor = make_sensor(sensor)
+        if isinstance(relay, str):
+            relay = make_relay(relay, pin=relay_pin, supress_warnings=supress_gpio_warnings)
+        self.clock = clock or SystemClock()
+        self.events = EventBroadcaster()
+        self.sensor = sensor
+        # The sampler is the only thing that talks to the sensor, everyone else reads its latest snapshot
+        self.sampler = SensorSampler(self.sensor, period=update_time, clock=self.clock)
+        self.sampler.sample()
+        log.info('Initialized %s sensor: %s°C', type(sensor).__name__, self.read_temp(), extra={'event': 'sensor'})
         self.relay_pin = relay_pin
-        GPIO.setwarnings(~supress_gpio_warnings)
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(self.relay_pin, GPIO.OUT)
-        self.setpoint = default_setpoint
+        self.relay = relay
+        self.relay_transitions = 0
+        # Heater on time up to the last turn off, plus the monotonic time it was last turned on while it's on
+        self._heater_on_seconds = 0.0
+        self._heater_on_since = self.clock.monotonic() if relay.get() else None
+        self.step = 0
+        # Request handlers and the control loop both change the state, only they take this lock, readers just grab
+        # self.state
+        self._state_lock = threading.Lock()
+        self.state = ControllerState(setpoint=default_setpoint, schedule=schedule,
+                                     compiled_schedule=schedule.compile())
+        # Bumped whenever the history or setpoint changes, for caching what's built from them
+        self.history_version = 0
         self.update_time = update_time
         self.max_length = int(timespan * 60 / update_time / log_interval) + 1
         self.data_file = data_file
-        self.schedule = schedule
-        self.schedule_enabled = True
+        # Start time of the schedule transition last applied, so each one is applied once and manual changes stick
+        # until the next one. Only the control loop touches these, it starts over when it sees a new schedule_version.
+        self._applied_transition = None
+        # Epoch time of the next transition, nothing to look up before then
+        self._next_schedule_check = 0
+        self._schedule_version = 0
+        self.preheat = RateEstimator() if preheat else None
+        self.max_preheat = max_preheat * 60
+        # When to start heating for the next scheduled raise, and that transition with its datetime
+        self._preheat_at = math.inf
+        self._preheat_for = None
         self.log_interval = log_interval
-
-        json.dump({
-            'update_time': self.update_time,
-            'timespan': timespan
-        }, open(config_file, 'w'))
+        self.max_staleness = max_staleness
+        self.ticker = Ticker(update_time, clock=self.clock, policy=missed_ticks)
+        # Disk writes and logging happen here, off the tick, once the control loop is running
+        self.writer = BackgroundWriter()
+        self.journal = RelayJournal(path=journal_file)
+        self.duty = DutyCycle()
+        self._restore_transitions()
+
+        if config_file is not None:
+            json.dump({
+                'update_time': self.update_time,
+                'timespan': timespan
+            }, open(config_file, 'w'))
 
         temp = self.read_temp()
-        self.temp_history = deque([temp], maxlen=self.max_length)
-        self.setpoint_history = deque([self.setpoint], maxlen=self.max_length)
-        self.time_history = deque([datetime.now()], maxlen=self.max_length)
+        self.history = HistoryBuffer(self.max_length)
+        self.rollups = Rollups()
+        self._rollups_lock = threading.Lock()
+        self._rollups_pending = None  # samples logged while the rollups are rebuilt, see restore_rollups
+        self.store = None
+        if data_file is not None:
+            self.store = SampleStore(data_file)
+            records = self.store.tail(self.max_length)
+            if len(records):
+                self.history.restore(int(records['seq'][-1]), records['temperature'], records['setpoint'],
+                                     records['time'], records['heater'])
+                log.info('Restored %d samples from %s', len(records), data_file, extra={'event': 'restore'})
+                if self.preheat is not None:
+                    for i in range(len(records)):
+                        self.preheat.observe(records['time'][i], records['temperature'][i], records['heater'][i])
+        self.log_sample(temp, self.setpoint)
+
+    def _restore_transitions(self):
+        """Replays the stored relay transitions into the duty cycle aggregates."""
+        records = self.journal.load()
+        for record in records:
+            self.duty.record(float(record['time']), int(record['state']))
+        if len(records):
+            log.info('Restored %d relay transitions from %s', len(records), self.journal.path,
+                     extra={'event': 'restore'})
+        last = self.journal.last()
+        state = self.relay.get()
+        if (last['state'] if last is not None else 0) != state:
+            # A heater run left open by a restart is taken to have ended at the restart
+            self._record_transition(state)
+
+    def _record_transition(self, state):
+        now = self.clock.time()
+        temperature = self.read_temp()
+        self.writer.submit(self.journal.write, self.journal.append(now, temperature, state))
+        self.duty.record(now, state)
+        return now, temperature
+
+    def get_duty_cycle(self, period='day', count=1):
+        return self.duty.summary(period, self.clock.time(), count)
+
+    def restore_rollups(self):
+        """
+        Rebuilds the rollups from the stored samples on a background thread and returns it. Up to the whole retention
+        period is read from disk, seconds on a Pi, and the control loop mustn't wait for that with the relay left as
+        it was. Until the new rollups are swapped in the long range queries only see samples logged since startup.
+        """
+        if self.store is None:
+            return None
+        with self._rollups_lock:
+            self._rollups_pending = []
+        thread = threading.Thread(target=self._rebuild_rollups, name='rollups-restore', daemon=True)
+        thread.start()
+        return thread
+
+    def _rebuild_rollups(self):
+        try:
+            records = self.store.read(start=self.clock.time() - self.rollups.retention)
+            rollups = Rollups()
+            rollups.load(records['time'], records['temperature'], records['setpoint'], records['heater'])
+        except Exception as e:
+            with self._rollups_lock:
+                self._rollups_pending = None
+            log.exception('Rebuilding the rollups failed: %r', e, extra={'event': 'restore'})
+            return
+        last = records['time'][-1] if len(records) else -math.inf
+        with self._rollups_lock:
+            # The store is written from the background writer, samples logged meanwhile may or may not have made it
+            for sample in self._rollups_pending:
+                if sample[0] > last:
+                    rollups.add(*sample)
+            self._rollups_pending = None
+            self.rollups = rollups
+        log.info('Rebuilt rollups from %d stored samples', len(records), extra={'event': 'restore'})
+
+    def _publish(self, **changes):
+        """Replaces the state with a copy carrying the changes, returns the new state."""
+        with self._state_lock:
+            state = self.state
+            if 'schedule' in changes or 'schedule_enabled' in changes:
+                changes['schedule_version'] = state.schedule_version + 1
+            self.state = replace(state, version=state.version + 1, **changes)
+            return self.state
+
+    @property
+    def setpoint(self):
+        return self.state.setpoint
+
+    @property
+    def schedule(self):
+        return self.state.schedule
+
+    @property
+    def compiled_schedule(self):
+        return self.state.compiled_schedule
+
+    @property
+    def schedule_enabled(self):
+        return self.state.schedule_enabled
+
+    @property
+    def schedule_version(self):
+        return self.state.schedule_version
 
     def toggle_schedule(self, state=True):
-        self.schedule_enabled = state
+        self._publish(schedule_enabled=state)
+        self.events.publish('schedule_state', {'state': state})
 
     def get_schedule_state(self):
         return self.schedule_enabled
 
     def set_schedule(self, schedule: dict[str, Union[float, str]]):
-        self.schedule = TemperatureSchedule()
-        self.schedule.from_dict(schedule)
+        """Raises ValueError for a schedule that doesn't check out, see TemperatureSchedule.from_dict."""
+        new_schedule = TemperatureSchedule()
+        new_schedule.from_dict(schedule)
+        # Compiled before publishing, so the control loop never sees the new schedule without its table
+        self._publish(schedule=new_schedule, compiled_schedule=new_schedule.compile())
+        self.events.publish('schedule', new_schedule.to_dict())
+
+    def next_transition(self, when=None):
+        return self.compiled_schedule.next_transition(when or self.clock.now())
+
+    def apply_schedule(self, now, state=None):
+        compiled = (state or self.state).compiled_schedule
+        transition, started = compiled.active(now)
+        if transition is None:
+            return
+        _, upcoming = compiled.next_transition(now)
+        self._next_schedule_check = upcoming.timestamp()
+        if started == self._applied_transition:
+            return
+        # Also covers transitions missed while the backend was down, the one currently in effect is applied
+        log.info('%s, setting temperature to %s°C', transition.name, transition.setpoint, extra={'event': 'schedule'})
+        self.update_setpoint(transition.setpoint)
+        self._applied_transition = started
+
+    def _plan_preheat(self, temp):
+        """Works out when to start heating to reach the next scheduled raise on time, with every logged sample."""
+        self._preheat_at = math.inf
+        state = self.state
+        if not state.schedule_enabled:
+            return
+        transition, when = state.compiled_schedule.next_transition(self.clock.now())
+        if transition is None or transition.setpoint <= state.setpoint or when == self._applied_transition:
+            return
+        lead = self.preheat.time_to_reach(temp, transition.setpoint, self.max_preheat)
+        if lead > 0:
+            self._preheat_at = when.timestamp() - lead
+            self._preheat_for = (transition, when)
+
+    def _start_preheat(self):
+        transition, when = self._preheat_for
+        self._preheat_at = math.inf
+        log.info('Preheating for %s at %s, setting temperature to %s°C', transition.name, when.strftime('%H:%M'),
+                 transition.setpoint, extra={'event': 'preheat'})
+        self.update_setpoint(transition.setpoint)
+        # The transition counts as applied, so it isn't applied again when its time comes
+        self._applied_transition = when
+
+    def get_preheat(self):
+        if self.preheat is None:
+            return {'enabled': False}
+        planned = math.isfinite(self._preheat_at)
+        return {
+            'enabled': True,
+            **self.preheat.to_dict(),
+            'start': self._preheat_at if planned else None,
+            'target_time': self._preheat_for[1].isoformat() if planned else None,
+            'target': self._preheat_for[0].setpoint if planned else None,
+        }
 
     def read_temp(self):
-        return self.tmp75.read_temp()
-
-    def update_setpoint(self, setpoint):
-        self.setpoint = setpoint
+        return self.sampler.latest().value
 
-    def get_temperature_history(self):
-        return list(self.temp_history)
+    def latest_reading(self):
+        return self.sampler.latest()
 
-    def get_setpoint_history(self):
-        return list(self.setpoint_history)
+    def update_setpoint(self, setpoint):
+        """Raises ValueError for anything but a number between MIN_SETPOINT and MAX_SETPOINT."""
+        if isinstance(setpoint, bool) or not isinstance(setpoint, numbers.Real) or \
+                not MIN_SETPOINT <= setpoint <= MAX_SETPOINT:
+            raise ValueError(f'setpoint must be a number between {MIN_SETPOINT} and {MAX_SETPOINT}°C, '
+                             f'got {setpoint!r}')
+        with self._state_lock:
+            changed = setpoint != self.state.setpoint
+            if changed:
+                self.state = replace(self.state, setpoint=setpoint, version=self.state.version + 1)
+        if changed:
+            self.history_version += 1
+            self.events.publish('setpoint', {'setpoint': setpoint})
+
+    def get_reading(self):
+        return self.latest_reading().to_dict(now=self.clock.monotonic())
+
+    def get_state(self):
+        """Everything a dashboard needs to render, sent as the first event on a new stream."""
+        reading = self.latest_reading()
+        state = self.state
+        return {
+            'temperature': reading.value,
+            'time': reading.read_time,
+            'setpoint': state.setpoint,
+            'heater_state': self.heater_state(),
+            'schedule_state': state.schedule_enabled,
+            'cursor': self.history.last_seq,
+        }
 
-    def get_time_history(self):
-        return list(self.time_history)
+    def get_history_snapshot(self):
+        return self.history.snapshot()
+
+    def read_history(self, reader, *args):
+        """reader(*args), rerun if the history snapshots it used were written over meanwhile, see HistoryBuffer.read."""
+        return self.history.read(reader, *args)
+
+    def get_history_since(self, seq):
+        return self.history.since(seq)
+
+    def query_history(self, start, end, max_points):
+        """
+        [start, end) in at most max_points points, picked from the raw history or the coarsest rollup needed.
+        Returns (series, resolution) with resolution None for raw samples, else the bucket width in seconds.
+        """
+        # The result can hold views of the history, so serialize it inside read_history
+        snapshot = self.history.snapshot()
+        raw = Series(time=snapshot.time, temperature=snapshot.temperature, minimum=snapshot.temperature,
+                     maximum=snapshot.temperature, setpoint=snapshot.setpoint, duty=snapshot.heater)
+        return self.rollups.query(raw, start, end, max_points)
+
+    def get_temperature_history(self, snapshot=None):
+        snapshot = self.history.snapshot() if snapshot is None else snapshot
+        return snapshot.temperature.tolist()
+
+    def get_setpoint_history(self, snapshot=None):
+        snapshot = self.history.snapshot() if snapshot is None else snapshot
+        # Setpoints are stored as float32, round so 20.3 doesn't come back as 20.299999237060547
+        return snapshot.setpoint.astype(float).round(2).tolist()
+
+    def get_time_history(self, snapshot=None):
+        snapshot = self.history.snapshot() if snapshot is None else snapshot
+        return [datetime.fromtimestamp(t) for t in snapshot.time.tolist()]
+
+    def log_sample(self, temp, setpoint):
+        now = self.clock.time()
+        heater = self.heater_state()
+        self.history.append(temp, setpoint, now, heater)
+        self.history_version += 1
+        with self._rollups_lock:
+            self.rollups.add(now, temp, setpoint, heater)
+            if self._rollups_pending is not None:
+                self._rollups_pending.append((now, temp, setpoint, heater))
+        seq = self.history.last_seq
+        if self.store is not None:
+            self.writer.submit(self.store.append, seq, now, temp, setpoint, heater)
+        if self.preheat is not None:
+            self.preheat.observe(now, temp, heater)
+            self._plan_preheat(temp)
+        self.events.publish('sample', {
+            'seq': seq,
+            'time': now,
+            'temperature': temp,
+            'setpoint': setpoint,
+            'heater_state': heater,
+        })
 
     def _set_relay(self, state):
-        GPIO.output(self.relay_pin, state)
+        changed = self.heater_state() != state
+        self.relay.set(state)
+        if changed:
+            self.relay_transitions += 1
+            now = self.clock.monotonic()
+            if state:
+                self._heater_on_since = now
+            elif self._heater_on_since is not None:
+                self._heater_on_seconds += now - self._heater_on_since
+                self._heater_on_since = None
+            when, temperature = self._record_transition(state)
+            self.events.publish('heater', {
+                'heater_state': state,
+                'temperature': temperature,
+                'time': when,
+            })
 
     def turn_on_heater(self):
         self._set_relay(1)
@@ -128,80 +518,75 @@ class TemperatureController(ABC):
         self._set_relay(0)
 
     def heater_state(self):
-        return GPIO.input(self.relay_pin)
+        return self.relay.get()
+
+    def heater_on_seconds(self):
+        """Total time the heater has been on since startup."""
+        since = self._heater_on_since
+        return self._heater_on_seconds + (self.clock.monotonic() - since if since is not None else 0.0)
 
     def is_heater_on(self):
-        return self.heater_state() == GPIO.HIGH
+        return self.heater_state() == 1
 
     def is_heater_off(self):
-        return self.heater_state() == GPIO.LOW
+        return self.heater_state() == 0
 
     def control_loop(self):
-        step = 0
-        last_update_day = None
-        event_triggered = {
-            'weekday_wakeup': False,
-            'leave_for_work': False,
-            'home_from_work': False,
-            'weekday_bedtime': False,
-            'weekend_wakeup': False,
-            'weekend_bedtime': False,
-        }
-
-        while True:
-            if self.schedule_enabled:
-                now = datetime.now()
-                current_time = now.time()
-                day_of_week = now.weekday()  # Monday is 0, Sunday is 6
-
-                # Check if it's a new day to reset event indicators
-                if last_update_day != now.date():
-                    for event in event_triggered:
-                        event_triggered[event] = False
-                    last_update_day = now.date()
-
-                # Update setpoint based on the schedule for weekdays
-                if day_of_week < 5:  # Weekday
-                    if not event_triggered['weekday_wakeup'] and current_time >= self.schedule.weekday_wakeup_time:
-                        print(f'Waking up, setting temperature to {self.schedule.wakeup_temperature}°C')
-                        self.setpoint = self.schedule.wakeup_temperature
-                        event_triggered['weekday_wakeup'] = True
-                    if not event_triggered['leave_for_work'] and current_time >= self.schedule.leave_for_work_time:
-                        print(f'Leaving for work, setting temperature to {self.schedule.at_work_temperature}°C')
-                        self.setpoint = self.schedule.at_work_temperature
-                        event_triggered['leave_for_work'] = True
-                    if not event_triggered['home_from_work'] and current_time >= self.schedule.home_from_work_time:
-                        print(f'Home from work, setting temperature to {self.schedule.wakeup_temperature}°C')
-                        self.setpoint = self.schedule.wakeup_temperature  # Assuming you want to return to the wakeup temperature
-                        event_triggered['home_from_work'] = True
-                    if not event_triggered['weekday_bedtime'] and current_time >= self.schedule.weekday_bedtime:
-                        print(f'Bedtime, setting temperature to {self.schedule.bedtime_temperature}°C')
-                        self.setpoint = self.schedule.bedtime_temperature
-                        event_triggered['weekday_bedtime'] = True
-                else:  # Weekend
-                    if not event_triggered['weekend_wakeup'] and current_time >= self.schedule.weekend_wakeup_time:
-                        print(f'Waking up, setting temperature to {self.schedule.wakeup_temperature}°C')
-                        self.setpoint = self.schedule.wakeup_temperature
-                        event_triggered['weekend_wakeup'] = True
-                    if not event_triggered['weekend_bedtime'] and current_time >= self.schedule.weekend_bedtime:
-                        print(f'Bedtime, setting temperature to {self.schedule.bedtime_temperature}°C')
-                        self.setpoint = self.schedule.bedtime_temperature
-                        event_triggered['weekend_bedtime'] = True
-
-            temp = self.read_temp()
-
-            setpoint = self.setpoint
-            assert 10 <= setpoint <= 25, f'{setpoint=} out of range.'
-
-            self.control_step(temp=temp, setpoint=self.setpoint)
-            if (step % self.log_interval) == 0:
-                self.temp_history.append(temp)
-                self.setpoint_history.append(setpoint)
-                self.time_history.append(datetime.now())
-                print(f'Temp: {temp}°C | Setpoint: {setpoint}°C | Heater: {"ON" if self.is_heater_on() else "OFF"}')
-
-            sleep(self.update_time)
-            step += 1
+        self.restore_rollups()
+        self.sampler.start()
+        self.writer.start()
+        self.ticker.run(self.tick)
+
+    def get_terms(self):
+        """The controller's internal state and parameters, for tuning. Subclasses add theirs."""
+        return {'controller': type(self).__name__}
+
+    def get_loop_stats(self):
+        stats = self.ticker.stats.to_dict()
+        stats.update({
+            'period': self.update_time,
+            'missed_ticks': self.ticker.policy,
+            'writer_queue': len(self.writer),
+            'writer_dropped': self.writer.dropped,
+            'writer_errors': self.writer.errors,
+        })
+        return stats
+
+    def tick(self):
+        """One pass of the control loop: apply the schedule, run control_step on the latest reading, log."""
+        state = self.state
+        if state.schedule_version != self._schedule_version:
+            # The schedule was changed or switched on or off since the last tick, look it up again
+            self._schedule_version = state.schedule_version
+            self._applied_transition = None
+            self._next_schedule_check = 0
+            self._preheat_at = math.inf
+        if state.schedule_enabled and self.clock.time() >= self._next_schedule_check:
+            self.apply_schedule(self.clock.now(), state)
+        if self.clock.time() >= self._preheat_at:
+            self._start_preheat()
+
+        reading = self.latest_reading()
+        temp = reading.value
+
+        setpoint = self.setpoint
+        assert MIN_SETPOINT <= setpoint <= MAX_SETPOINT, f'{setpoint=} out of range.'
+
+        staleness = reading.staleness(now=self.clock.monotonic())
+        if staleness > self.max_staleness:
+            # Don't control off a reading we can't trust, fail safe with the heater off
+            if self.is_heater_on():
+                log.warning('Sensor reading is %.0fs old, turning heater off.', staleness, extra={'event': 'stale'})
+                self.turn_off_heater()
+        else:
+            self.control_step(temp=temp, setpoint=setpoint)
+        if self.events:
+            self.events.publish('reading', reading.to_dict(now=self.clock.monotonic()))
+        if (self.step % self.log_interval) == 0:
+            self.log_sample(temp, setpoint)
+            self.writer.submit(log.info, 'Temp: %s°C | Setpoint: %s°C | Heater: %s', temp, setpoint,
+                               'ON' if self.is_heater_on() else 'OFF', extra={'event': 'status'})
+        self.step += 1
 
     @abstractmethod
     def control_step(self, temp, setpoint):
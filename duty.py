@@ -0,0 +1,200 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# time, temperature at the switch, new relay state
+TRANSITION_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('temperature', '<f4'),
+    ('state', 'u1'),
+    ('pad', 'V3'),
+])
+
+
+class RelayJournal:
+    """
+    Every relay transition with its time and the temperature at the switch, the last `capacity` of them in memory in a
+    preallocated array and all of them appended to `path` as 16 byte records if one is given. A few dozen switches a
+    day add up to a few hundred kB a year, so the file is never rotated.
+    """
+
+    def __init__(self, capacity=4096, path=None):
+        self.capacity = capacity
+        self.path = path
+        self._records = np.zeros(capacity, dtype=TRANSITION_DTYPE)
+        self._head = 0  # total number of transitions
+        self._fd = None
+
+    def __len__(self):
+        return min(self._head, self.capacity)
+
+    def load(self):
+        """Reads back the transitions stored in `path`, returns them oldest first."""
+        if self.path is None or not os.path.exists(self.path):
+            return np.zeros(0, dtype=TRANSITION_DTYPE)
+        data = open(self.path, 'rb').read()
+        # A crash can leave a partial record at the end, it's dropped and overwritten by the next append
+        whole = len(data) // TRANSITION_DTYPE.itemsize * TRANSITION_DTYPE.itemsize
+        if whole != len(data):
+            os.truncate(self.path, whole)
+        records = np.frombuffer(data[:whole], dtype=TRANSITION_DTYPE)
+        for record in records[-self.capacity:]:
+            self._add(record['time'], record['temperature'], record['state'])
+        return records
+
+    def append(self, time, temperature, state):
+        """Records a transition in memory and returns the record to pass to write()."""
+        return self._add(time, temperature, state).tobytes()
+
+    def write(self, record: bytes):
+        """Appends a record returned by append() to the file, on the background writer."""
+        if self.path is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, record)
+
+    def last(self):
+        """The newest transition, or None."""
+        return self._records[(self._head - 1) % self.capacity] if self._head else None
+
+    def recent(self, n):
+        """Copy of the last n transitions, oldest first."""
+        n = min(n, len(self))
+        index = (self._head - n + np.arange(n)) % self.capacity
+        return self._records[index]
+
+    def _add(self, time, temperature, state):
+        record = self._records[self._head % self.capacity]
+        record['time'], record['temperature'], record['state'] = time, temperature, state
+        self._head += 1
+        return record
+
+
+def _hour(when):
+    start = datetime.fromtimestamp(when).replace(minute=0, second=0, microsecond=0)
+    return start.timestamp(), (start + timedelta(hours=1)).timestamp()
+
+
+def _day(when):
+    start = datetime.fromtimestamp(when).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+
+# name -> (bucket bounds of a timestamp in local time, number of buckets kept)
+PERIODS = {
+    'hour': (_hour, 48),
+    'day': (_day, 62),
+}
+
+
+class DutyBucket:
+    __slots__ = ('start', 'end', 'on_seconds', 'cycles', 'on_runs', 'on_run_seconds', 'cycle_runs', 'cycle_seconds')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.on_seconds = 0.0  # of heater runs that have ended, the one in progress is added when asked
+        self.cycles = 0  # times the heater turned on
+        # Heater runs that ended in this bucket and their total length
+        self.on_runs = 0
+        self.on_run_seconds = 0.0
+        # Turn on to turn on periods that ended in this bucket and their total length
+        self.cycle_runs = 0
+        self.cycle_seconds = 0.0
+
+
+class DutyPeriods:
+    """
+    Running per-bucket heater aggregates for one period: on time, cycles, mean run and cycle length. They are updated
+    on each transition, in time proportional to the buckets a run spans, and a summary only looks at the buckets
+    asked for, whatever the history behind them.
+    """
+
+    def __init__(self, bounds, capacity):
+        self.bounds = bounds
+        self.buckets = deque(maxlen=capacity)
+
+    def bucket(self, when):
+        """The bucket holding `when`, opening it and any empty ones before it. Times before the newest go into it."""
+        if self.buckets and when < self.buckets[-1].end:
+            return self.buckets[-1]
+        start, end = self.bounds(when)
+        if self.buckets and self.buckets[-1].end < start:
+            # Fill the gap so the buckets stay consecutive, at most a deque's worth
+            gap_start = max(self.buckets[-1].end, start - (self.buckets.maxlen - 1) * (end - start))
+            while gap_start < start:
+                gap_start, gap_end = self.bounds(gap_start)
+                self.buckets.append(DutyBucket(gap_start, gap_end))
+                gap_start = gap_end
+        self.buckets.append(DutyBucket(start, end))
+        return self.buckets[-1]
+
+    def add_on_time(self, start, end):
+        """Spreads a heater run over the buckets it overlaps, newest first."""
+        self.bucket(end)
+        for bucket in reversed(self.buckets):
+            if bucket.end <= start:
+                break
+            bucket.on_seconds += max(0.0, min(end, bucket.end) - max(start, bucket.start))
+
+
+class DutyCycle:
+    """Heater aggregates per hour and per day, kept up to date from the relay transitions."""
+
+    def __init__(self, periods=None):
+        self.periods = {name: DutyPeriods(bounds, capacity) for name, (bounds, capacity) in (periods or PERIODS).items()}
+        self._on_since = None  # time the heater was turned on, while it's on
+        self._last_on = None  # time the heater was last turned on
+        self._lock = threading.Lock()
+
+    def record(self, when, state):
+        with self._lock:
+            if state and self._on_since is None:
+                for period in self.periods.values():
+                    bucket = period.bucket(when)
+                    bucket.cycles += 1
+                    if self._last_on is not None:
+                        bucket.cycle_runs += 1
+                        bucket.cycle_seconds += when - self._last_on
+                self._on_since = self._last_on = when
+            elif not state and self._on_since is not None:
+                for period in self.periods.values():
+                    period.add_on_time(self._on_since, when)
+                    bucket = period.bucket(when)
+                    bucket.on_runs += 1
+                    bucket.on_run_seconds += when - self._on_since
+                self._on_since = None
+
+    def summary(self, period, now, count=1):
+        """
+        The last `count` buckets of `period` up to now, newest first, each with its on time and duty cycle so far
+        (counting a heater run still in progress), the number of cycles started, and the mean length of the heater
+        runs and of the on to on cycles that ended in it, None if there were none.
+        """
+        with self._lock:
+            periods = self.periods[period]
+            periods.bucket(now)
+            on_since = self._on_since
+            buckets = [periods.buckets[-i] for i in range(1, min(count, len(periods.buckets)) + 1)]
+            result = []
+            for bucket in buckets:
+                end = min(bucket.end, now)
+                on_seconds = bucket.on_seconds
+                if on_since is not None:
+                    on_seconds += max(0.0, end - max(on_since, bucket.start))
+                elapsed = end - bucket.start
+                result.append({
+                    'start': bucket.start,
+                    'end': bucket.end,
+                    'on_seconds': round(on_seconds, 3),
+                    'duty': round(on_seconds / elapsed, 4) if elapsed > 0 else None,
+                    'cycles': bucket.cycles,
+                    'mean_on_seconds': round(bucket.on_run_seconds / bucket.on_runs, 3) if bucket.on_runs else None,
+                    'mean_cycle_seconds': round(bucket.cycle_seconds / bucket.cycle_runs, 3)
+                    if bucket.cycle_runs else None,
+                })
+        return result
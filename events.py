@@ -0,0 +1,138 @@
+import asyncio
+import json
+import queue
+import threading
+from collections import deque
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    def __init__(self, broadcaster, max_queue):
+        self.broadcaster = broadcaster
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def offer(self, message):
+        """Queues a message without blocking, False if the queue is full."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def stream(self, initial=None, keepalive=15):
+        """
+        Yields server-sent event messages until the subscriber is dropped or the client goes away. A comment line is
+        sent every keepalive seconds so dead connections get noticed and proxies don't time the stream out.
+        """
+        try:
+            if initial is not None:
+                yield initial
+            while not self.dropped:
+                try:
+                    yield self.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.broadcaster.unsubscribe(self)
+
+
+class AsyncSubscription:
+    """A Subscription read from an asyncio event loop, events can still be published from any thread."""
+
+    def __init__(self, broadcaster, max_queue, loop):
+        self.broadcaster = broadcaster
+        self.max_queue = max_queue
+        self.loop = loop
+        self.pending = deque()
+        self.dropped = False
+        self._ready = asyncio.Event()
+
+    def offer(self, message):
+        if len(self.pending) >= self.max_queue:
+            return False
+        self.pending.append(message)
+        self.loop.call_soon_threadsafe(self._ready.set)
+        return True
+
+    async def stream(self, initial=None, keepalive=15):
+        """Subscription.stream as an async generator."""
+        try:
+            if initial is not None:
+                yield initial
+            while not self.dropped:
+                if not self.pending:
+                    self._ready.clear()
+                    try:
+                        await asyncio.wait_for(self._ready.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+                        continue
+                while self.pending:
+                    yield self.pending.popleft()
+        finally:
+            self.broadcaster.unsubscribe(self)
+
+
+class EventBroadcaster:
+    """
+    Fans events out to every subscriber through a bounded queue each. Publishing never blocks: a subscriber whose queue
+    is full has fallen behind and gets dropped, its client can reconnect and start from a fresh state event.
+    """
+
+    def __init__(self, max_queue=64):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscription = Subscription(self, self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def subscribe_async(self, loop=None):
+        subscription = AsyncSubscription(self, self.max_queue, loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def stream(self, initial=None, keepalive=15):
+        """
+        Subscription.stream of a subscription that's only made once the stream is first iterated, so a response that is
+        never sent (a HEAD request, a client gone before the first byte) doesn't hold one. initial is called for the
+        first message after subscribing, so nothing published in between goes missing.
+        """
+        subscription = self.subscribe()
+        yield from subscription.stream(initial() if initial else None, keepalive)
+
+    async def stream_async(self, initial=None, keepalive=15):
+        """stream for an asyncio event loop."""
+        stream = self.subscribe_async().stream(initial() if initial else None, keepalive)
+        try:
+            async for message in stream:
+                yield message
+        finally:
+            await stream.aclose()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, data):
+        if not self._subscribers:
+            return
+        # Serialize once, every subscriber gets the same message
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.offer(message):
+                subscription.dropped = True
+                self.unsubscribe(subscription)
@@ -0,0 +1,72 @@
+"""
+Sensor and relay drivers, looked up by name and only imported when selected, so nothing touches smbus or RPi.GPIO
+unless that hardware is actually in use.
+"""
+import importlib
+from abc import ABC, abstractmethod
+
+
+class Sensor(ABC):
+    # Seconds between two reads for the second one to see a new conversion
+    min_interval = 0.0
+
+    @abstractmethod
+    def read_temp(self):
+        """Temperature in degrees Celsius."""
+        raise NotImplementedError
+
+
+class Relay(ABC):
+    @abstractmethod
+    def set(self, state):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self):
+        """1 when the relay is closed (heater on), 0 otherwise."""
+        raise NotImplementedError
+
+
+class NullRelay(Relay):
+    """Remembers the state without switching anything, for running the backend as a monitor only."""
+
+    def __init__(self, **kwargs):
+        self.state = 0
+
+    def set(self, state):
+        self.state = int(state)
+
+    def get(self):
+        return self.state
+
+
+# name -> 'module:class', resolved on first use
+SENSORS = {
+    'tmp75': 'tmp75:TMP75',
+}
+
+RELAYS = {
+    'gpio': 'relay:GPIORelay',
+    'none': 'hardware:NullRelay',
+}
+
+
+def _load(registry, kind, name):
+    try:
+        module, cls = registry[name].split(':')
+    except KeyError:
+        raise ValueError(f'Unknown {kind} driver {name!r}, expected one of {sorted(registry)}') from None
+    return getattr(importlib.import_module(module), cls)
+
+
+def make_sensor(name='tmp75', filter=None, **kwargs) -> Sensor:
+    """filter, if given, is a dict of SensorFilter options to wrap the sensor's reads in."""
+    sensor = _load(SENSORS, 'sensor', name)(**kwargs)
+    if filter:
+        from sensor_filter import SensorFilter
+        sensor = SensorFilter(sensor, **filter)
+    return sensor
+
+
+def make_relay(name='gpio', **kwargs) -> Relay:
+    return _load(RELAYS, 'relay', name)(**kwargs)
@@ -1,5 +1,10 @@
+import logging
+
+import numpy as np
+
 from controller import TemperatureController
-from RPi import GPIO
+
+log = logging.getLogger(__name__)
 
 
 class HysteresisController(TemperatureController):
@@ -9,8 +14,17 @@ class HysteresisController(TemperatureController):
 
     def control_step(self, temp, setpoint):
         if temp < setpoint - self.hysteresis and self.is_heater_off():
-            print(f'Heater turned on. Temp: {temp}°C | Setpoint: {setpoint}°C')
+            log.info('Heater turned on. Temp: %s°C | Setpoint: %s°C', temp, setpoint, extra={'event': 'heater'})
             self.turn_on_heater()
         elif temp >= setpoint + self.hysteresis and self.is_heater_on():
-            print(f'Heater turned off. Temp: {temp}°C | Setpoint: {setpoint}°C')
+            log.info('Heater turned off. Temp: %s°C | Setpoint: %s°C', temp, setpoint, extra={'event': 'heater'})
             self.turn_off_heater()
+
+    def get_terms(self):
+        return {**super().get_terms(), 'hysteresis': self.hysteresis}
+
+    @staticmethod
+    def batch_step(temp, setpoint, heater, hysteresis):
+        """control_step over numpy arrays of independent controllers, returns the new heater states."""
+        # Off: turn on below setpoint - hysteresis. On: stay on until setpoint + hysteresis is reached.
+        return np.where(heater, temp < setpoint + hysteresis, temp < setpoint - hysteresis).astype(np.uint8)
@@ -1,20 +1,22 @@
 from collections import deque
 
-import RPi.GPIO as GPIO
-import numpy as np
-import plotly
-import plotly.graph_objs as go
-from dash import Dash, dcc, html, dash
-from dash.dependencies import Output, Input
-import json
+import requests
+from dash import Dash, dcc, html, no_update
+from dash.dependencies import Output, Input, State
 from flask import jsonify
 from dash.exceptions import PreventUpdate
 
+import wire
+
 app = Dash(__name__)
 
+BACKEND_URL = "http://localhost:1111"
+
 MAX_TIME = 60  # n mins
 UPDATE_TIME = 2  # update every n seconds
 TICK_INTERVAL = 15  # in minutes
+SAMPLE_INTERVAL = 40  # seconds between the backend's logged samples, its update_time * log_interval
+MAX_POINTS = MAX_TIME * 60 // SAMPLE_INTERVAL + 1
 
 SETPOINT = 19.5
 SLIDER_MIN = 16
@@ -22,27 +24,39 @@ SLIDER_MAX = 22
 SLIDER_STEP = 0.5
 SLIDER_TICK_STEP = 1
 
-RELAY_PIN = 35
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BOARD)
-GPIO.setup(RELAY_PIN, GPIO.OUT)
-
-X = list(np.arange(0, int(MAX_TIME * 60) + 1, UPDATE_TIME))
-X_TICK_VALS = X[::-1][::int(TICK_INTERVAL * 60 / UPDATE_TIME)][::-1]
-# convert to string in hr:min format
-X_TICK_TEXT = [f"{i // 60}:{i % 60:02}" for i in [(MAX_TIME - i // 60) for i in X_TICK_VALS]]
-X_TICK_TEXT[-1] = "now"
+# Keeps the connection to the backend open between polls
+session = requests.Session()
+
+# Axes and ticks are set once here, the updates only carry new points. Times are epoch milliseconds on a date axis,
+# so a gap in the samples shows as a gap rather than shifting the line
+FIGURE = {
+    'data': [
+        {'type': 'scatter', 'x': [], 'y': [], 'name': 'Temperature', 'mode': 'lines', 'line': {'color': 'blue'}},
+        {'type': 'scatter', 'x': [], 'y': [], 'name': 'Setpoint', 'mode': 'lines', 'line': {'color': 'green'},
+         'showlegend': True},
+    ],
+    'layout': {
+        'xaxis': {'title': 'Time', 'type': 'date', 'tickformat': '%H:%M', 'dtick': TICK_INTERVAL * 60 * 1000},
+        'yaxis': {'title': 'Temperature (°C)'},
+        'legend': {'yanchor': 'top', 'y': 0.99, 'xanchor': 'left', 'x': 0.01},
+        # Keeps zoom and legend clicks across replacements of the figure
+        'uirevision': 'live',
+    },
+}
 
 app.layout = html.Div(
     [
+        html.H3(id='status'),
         dcc.Graph(id='live-graph',
+                  figure=FIGURE,
                   animate=False),
         dcc.Interval(
             id='graph-update',
             interval=UPDATE_TIME * 1000,
             n_intervals=0
         ),
+        # backend history cursor of the last point plotted and what the status line shows
+        dcc.Store(id='plot-state'),
         dcc.Slider(
             id='temp-slider',
             min=SLIDER_MIN,
@@ -58,67 +72,62 @@ app.layout = html.Div(
 )
 
 
+def fetch_history(cursor):
+    """The samples logged after cursor, or the whole window from cursor 0, as columns. None if the backend is down."""
+    try:
+        response = session.get(f'{BACKEND_URL}/get_full_history', params={'since': cursor},
+                               headers={'Accept': wire.MEDIA_TYPE}, timeout=1)
+        response.raise_for_status()
+        return wire.decode(response.content)
+    except (requests.RequestException, ValueError):
+        return None
+
+
 @app.callback(
-    Output('live-graph', 'figure'),
-    [Input('graph-update', 'n_intervals')]
+    [Output('live-graph', 'extendData'), Output('live-graph', 'figure'), Output('plot-state', 'data'),
+     Output('status', 'children')],
+    [Input('graph-update', 'n_intervals')],
+    [State('plot-state', 'data')]
 )
-def update_graph_scatter(_):
-    try:
-        data = json.load(open('data.json', 'r'))
-    except json.decoder.JSONDecodeError:
+def update_graph_scatter(_, state):
+    state = state or {'cursor': None, 'temperature': None, 'setpoint': None, 'heater_state': None}
+    history = fetch_history(state['cursor'] or 0)
+    if history is None:
+        # Keep what's plotted and the cursor, the next poll picks up from there
         raise PreventUpdate()
 
-    setpoint_data = data['setpoint']
-    temp_data = data['temp']
-    assert len(setpoint_data) == len(temp_data) == len(
-        X), f"Data length mismatch: {len(temp_data)}, {len(setpoint_data)}, {len(X)}"
-
-    temp = temp_data[-1]
-    setpoint = setpoint_data[-1]
-
-    xaxis_dict = dict(
-        title='Time (hours:minutes)',
-        tickvals=X_TICK_VALS,
-        tickmode='array',
-        ticktext=X_TICK_TEXT,
-        range=[X[0], X[-1]]
-    )
-    y_min, y_max = min(min(temp_data), min(setpoint_data)) - .25, max(max(temp_data), max(setpoint_data)) + .25
-
-    data = plotly.graph_objs.Scatter(
-        x=X,
-        y=temp_data,
-        name='Temperature',
-        mode='lines',
-        # set color of the line based on RELAY_HISTORY
-        line=dict(color='blue')
-    )
-
-    setpoint_data = plotly.graph_objs.Scatter(
-        x=X,
-        y=setpoint_data,
-        name='Setpoint',
-        mode='lines',
-        line=dict(color='green'),
-        showlegend=True
-    )
-
-    is_on = GPIO.input(RELAY_PIN) == GPIO.HIGH
-    layout = go.Layout(xaxis=xaxis_dict,
-                       yaxis=dict(
-                           range=[y_min, y_max],
-                           title='Temperature (°C)\n'),
-                       title=f'Set: {setpoint}°C - Current: {temp:.2f}°C'
-                             f' - STATUS: {"ON" if is_on else "OFF"}',
-                       legend=dict(
-                           yanchor="top",
-                           y=0.99,
-                           xanchor="left",
-                           x=0.01
-                       )
-                       )
-
-    return {'data': [data, setpoint_data], 'layout': layout}
+    n = min(len(history['time']), MAX_POINTS)
+    x = (history['time'][-n:] * 1000).tolist()
+    temp = history['temperature'][-n:].astype(float).round(2).tolist()
+    setpoint = history['setpoint'][-n:].astype(float).round(2).tolist()
+    extend, figure = no_update, no_update
+    if state['cursor'] is None or history['reset']:
+        # First load, or the backend dropped samples we haven't seen: replace rather than append out of order
+        figure = {'data': [dict(trace) for trace in FIGURE['data']], 'layout': FIGURE['layout']}
+        for trace, y in zip(figure['data'], (temp, setpoint)):
+            trace['x'], trace['y'] = x, y
+    elif n:
+        extend = (dict(x=[x, x], y=[temp, setpoint]), [0, 1], MAX_POINTS)
+
+    # The backend owns the relay, ask it rather than reading the pin from a second process. It's polled every time
+    # since it changes between samples, if it can't be had the last known state is kept
+    heater_state = state['heater_state']
+    try:
+        heater_state = session.get(f'{BACKEND_URL}/get_heater_state', timeout=1).json()['heater_state']
+    except (requests.RequestException, ValueError, KeyError):
+        pass
+
+    new_state = {
+        'cursor': history['cursor'],
+        'temperature': temp[-1] if n else state['temperature'],
+        'setpoint': setpoint[-1] if n else state['setpoint'],
+        'heater_state': heater_state,
+    }
+    status = no_update
+    if new_state['temperature'] is not None and (n or heater_state != state['heater_state']):
+        status = f'Set: {new_state["setpoint"]}°C - Current: {new_state["temperature"]:.2f}°C' \
+                 f' - STATUS: {"ON" if heater_state else "OFF"}'
+    return extend, figure, new_state, status
 
 
 @app.callback(Output('slider-output-container', 'children'),
@@ -0,0 +1,127 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+from collections import deque
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+def _entry(record: logging.LogRecord, offset=None):
+    entry = {
+        'time': record.created,
+        'level': record.levelname,
+        'logger': record.name,
+        # Set with extra={'event': ...}, so clients can filter on what happened without parsing messages
+        'event': getattr(record, 'event', 'message'),
+        'message': record.getMessage(),
+    }
+    if offset is not None:
+        entry = {'offset': offset, **entry}
+    if record.exc_info:
+        entry['exception'] = logging.Formatter().formatException(record.exc_info)
+    return entry
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, the same fields /get_logs returns."""
+
+    def format(self, record):
+        return json.dumps(_entry(record), ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records as they are, QueueHandler would format them first, on the thread that logged. Messages are formatted
+    on the listener instead, so log arguments must not be changed after the call, which holds for the numbers and
+    strings logged here.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class LogRing(logging.Handler):
+    """
+    Keeps the last `capacity` records in memory as dicts, each with an offset counting every record handled, so
+    clients can tail the log by asking for what came after the last offset they saw.
+    """
+
+    def __init__(self, capacity=2000, level=logging.NOTSET):
+        super().__init__(level)
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._offset = 0  # offset of the newest entry, entries are numbered from 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def last_offset(self):
+        return self._offset
+
+    def emit(self, record):
+        # handle() holds self.lock around this, since() takes it too
+        try:
+            entry = _entry(record, self._offset + 1)
+        except Exception:
+            self.handleError(record)
+            return
+        self._offset += 1
+        self._entries.append(entry)
+
+    def since(self, after=0, limit=100, level=logging.NOTSET):
+        """
+        Returns (entries, cursor, reset) for up to `limit` entries at `level` or above logged after offset `after`,
+        oldest first. cursor is the offset to pass next time. reset is True when entries after `after` have already
+        been dropped from the ring, like HistoryBuffer.since.
+        """
+        with self.lock:
+            newest = self._offset
+            oldest = newest - len(self._entries) + 1
+            reset = not oldest - 1 <= after <= newest
+            if reset:
+                after = oldest - 1
+            # Offsets are consecutive, the first entry wanted is at a known position
+            entries = list(islice(self._entries, after - oldest + 1, None))
+        cursor = after
+        result = []
+        for entry in entries:
+            if len(result) == limit:
+                break
+            cursor = entry['offset']
+            if logging.getLevelName(entry['level']) >= level:
+                result.append(entry)
+        return result, cursor, reset
+
+
+def setup(path=None, level=logging.INFO, capacity=2000, max_bytes=1 << 20, backups=5):
+    """
+    Sends every logger's records at `level` and above to an in-memory LogRing, which is returned, and to `path` as
+    JSON lines rotated at max_bytes with `backups` old files kept. The console gets the same records when it's a
+    terminal and only warnings otherwise, so output redirected by nohup stays small.
+
+    Logging only queues the record, the handlers run on a listener thread, so a slow SD card write or rotation never
+    holds up the control tick that logged.
+    """
+    ring = LogRing(capacity)
+    handlers = [ring]
+    if path is not None:
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        file_handler.setFormatter(JSONFormatter())
+        handlers.append(file_handler)
+    console = logging.StreamHandler()
+    console.setLevel(logging.NOTSET if sys.stderr.isatty() else logging.WARNING)
+    console.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handlers.append(console)
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    # Whatever is still queued gets written out on the way down
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(records))
+    return ring
@@ -0,0 +1,96 @@
+import threading
+from bisect import bisect_left
+
+# Bucket upper bounds in seconds
+I2C_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+TICK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """
+    Fixed bucket histogram. The counts are allocated up front and observe() only bumps them, so it can sit on the
+    control tick or the sensor read permanently.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Renders metrics in the Prometheus text format. Every metric is a callback run at scrape time returning
+    (labels, value) pairs, value being a number or a Histogram. Counters the code already keeps, like sampler errors,
+    are read where they live instead of being counted twice.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, name, kind, help, collect):
+        if kind not in ('counter', 'gauge', 'histogram'):
+            raise ValueError(f'Unknown metric type {kind!r}')
+        self._metrics.append((name, kind, help, collect))
+
+    def counter(self, name, help, collect):
+        self.add(name, 'counter', help, collect)
+
+    def gauge(self, name, help, collect):
+        self.add(name, 'gauge', help, collect)
+
+    def histogram(self, name, help, collect):
+        self.add(name, 'histogram', help, collect)
+
+    def render(self):
+        lines = []
+        for name, kind, help, collect in self._metrics:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in collect():
+                if kind == 'histogram':
+                    lines.extend(self._render_histogram(name, labels, value))
+                elif value is not None:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _render_histogram(name, labels, histogram: Histogram):
+        with histogram._lock:
+            counts = list(histogram.counts)
+            total, count = histogram.sum, histogram.count
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield f'{name}_bucket{_format_labels({**labels, "le": _format_value(float(bound))})} {cumulative}'
+        yield f'{name}_sum{_format_labels(labels)} {_format_value(total)}'
+        yield f'{name}_count{_format_labels(labels)} {count}'
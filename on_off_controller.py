@@ -1,13 +1,24 @@
+import logging
+
+import numpy as np
+
 from controller import TemperatureController
 
+log = logging.getLogger(__name__)
+
 
 class OnOffController(TemperatureController):
     def control_step(self, temp, setpoint):
         if temp < setpoint:
             if not self.heater_state():
-                print(f'Heater turned on. Temp: {temp}°C | Setpoint: {setpoint}°C')
+                log.info('Heater turned on. Temp: %s°C | Setpoint: %s°C', temp, setpoint, extra={'event': 'heater'})
             self.turn_on_heater()
         elif temp >= setpoint:
             if self.heater_state():
-                print(f'Heater turned off. Temp: {temp}°C | Setpoint: {setpoint}°C')
+                log.info('Heater turned off. Temp: %s°C | Setpoint: %s°C', temp, setpoint, extra={'event': 'heater'})
             self.turn_off_heater()
+
+    @staticmethod
+    def batch_step(temp, setpoint, heater, hysteresis=0):
+        """control_step over numpy arrays of independent controllers, returns the new heater states."""
+        return (temp < setpoint).astype(np.uint8)
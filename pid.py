@@ -0,0 +1,99 @@
+import logging
+import math
+
+from controller import TemperatureController
+
+log = logging.getLogger(__name__)
+
+
+class PIDController(TemperatureController):
+    """
+    PID control of the heater duty cycle, for radiators too slow for on/off control. The output, between 0 and 1, is
+    the fraction of each time proportioning `window` the relay is on, so the relay switches at most twice per window.
+
+    Gains are per °C of error, with times in seconds: ki per °C second, kd per °C/s. The derivative is taken on the
+    measurement rather than the error, so setpoint changes don't kick the output, and low pass filtered with time
+    constant `derivative_filter` against the sensor's 0.0625°C steps. The integral only runs while the output isn't
+    saturated in the direction it would push, so it doesn't wind up during a long warm up. Pulses shorter than
+    min_on, and gaps shorter than min_off, are dropped, and the relay is never switched sooner than those after its
+    last switch.
+    """
+
+    def __init__(self, kp=1.0, ki=1 / 1800, kd=60, derivative_filter=120, window=15 * 60, min_on=120,
+                 min_off=120, **kwargs):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.derivative_filter = derivative_filter
+        self.window = window
+        self.min_on = min_on
+        self.min_off = min_off
+        self.p = self.i = self.d = 0.0
+        self.output = 0.0
+        self._last_time = None
+        self._last_temp = None
+        self._slope = 0.0  # filtered temperature change, °C per second
+        self._window_start = None
+        self._on_time = 0.0  # seconds the relay is on in the current window
+        self._last_switch = -math.inf
+        super().__init__(**kwargs)
+
+    def control_step(self, temp, setpoint):
+        now = self.clock.monotonic()
+        error = setpoint - temp
+        if self._last_time is not None:
+            dt = now - self._last_time
+            if dt > 0:
+                alpha = dt / (self.derivative_filter + dt)
+                self._slope += alpha * ((temp - self._last_temp) / dt - self._slope)
+                # Conditional integration, skipped while saturated and the error would push further out
+                if not (self.output >= 1 and error > 0 or self.output <= 0 and error < 0):
+                    self.i = min(max(self.i + self.ki * error * dt, 0.0), 1.0)
+        self._last_time, self._last_temp = now, temp
+        self.p = self.kp * error
+        self.d = -self.kd * self._slope
+        self.output = min(max(self.p + self.i + self.d, 0.0), 1.0)
+
+        if self._window_start is None or now - self._window_start >= self.window:
+            # The on time is fixed at the start of each window
+            self._window_start = now
+            on_time = self.output * self.window
+            if on_time < self.min_on:
+                on_time = 0.0
+            elif self.window - on_time < self.min_off:
+                on_time = self.window
+            self._on_time = on_time
+        self._switch(now - self._window_start < self._on_time, now, temp, setpoint)
+
+    def _switch(self, on, now, temp, setpoint):
+        if on == self.is_heater_on():
+            return
+        if now - self._last_switch < (self.min_on if self.is_heater_on() else self.min_off):
+            return
+        self._last_switch = now
+        log.info('Heater turned %s. Temp: %s°C | Setpoint: %s°C | Output: %.2f', 'on' if on else 'off', temp,
+                 setpoint, self.output, extra={'event': 'heater'})
+        if on:
+            self.turn_on_heater()
+        else:
+            self.turn_off_heater()
+
+    def get_terms(self):
+        terms = super().get_terms()
+        terms.update({
+            'p': round(self.p, 4),
+            'i': round(self.i, 4),
+            'd': round(self.d, 4),
+            'output': round(self.output, 4),
+            'on_time': self._on_time,
+            'window_elapsed': round(self.clock.monotonic() - self._window_start, 1)
+            if self._window_start is not None else None,
+            'kp': self.kp,
+            'ki': self.ki,
+            'kd': self.kd,
+            'derivative_filter': self.derivative_filter,
+            'window': self.window,
+            'min_on': self.min_on,
+            'min_off': self.min_off,
+        })
+        return terms
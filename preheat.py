@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+
+
+class RateEstimator:
+    """
+    Learns how fast the room warms up with the heater on and cools down with it off, by recursive least squares on the
+    logged samples: the temperature change per hour between two samples is fitted as heat * heater - loss. Each sample
+    is an O(1) update, nothing is kept but the two parameters and their 2x2 covariance.
+
+    The heat loss depends on the weather, which isn't measured, so old samples are forgotten with a time constant of
+    about `forgetting_samples` samples and the estimate follows the seasons. Forgetting only runs while the heater has
+    switched within the last `forgetting_samples` samples: without heater runs nothing new is learned about its heat,
+    and forgetting it anyway would let its variance grow until the first run after a summer overwrote the estimate.
+    The covariance's eigenvalues are also capped at `max_variance` for the same reason.
+    """
+
+    def __init__(self, forgetting_samples=2000, min_samples=50, min_gap=10, max_gap=15 * 60, max_variance=100.0):
+        self.forgetting_samples = forgetting_samples
+        self.forgetting = 1 - 1 / forgetting_samples
+        self.max_variance = max_variance
+        self.min_samples = min_samples
+        # In seconds. A sample closer than min_gap to the previous one is skipped, the change over so short a time is
+        # mostly sensor noise, and samples further apart than max_gap aren't compared
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.theta = np.zeros(2)  # heat, loss in °C per hour
+        self.covariance = np.eye(2) * max_variance
+        self.samples = 0
+        self._since_switch = math.inf  # samples since the heater state last changed
+        self._last = None
+
+    def observe(self, time, temperature, heater):
+        """Feeds one logged sample, the heater state is the one it was logged with, in effect until the next."""
+        last = self._last
+        if last is not None and 0 <= time - last[0] < self.min_gap:
+            return
+        self._last = (time, temperature, heater)
+        if last is None:
+            return
+        last_time, last_temperature, last_heater = last
+        self._since_switch = 0 if bool(heater) != bool(last_heater) else self._since_switch + 1
+        elapsed = time - last_time
+        if not 0 < elapsed <= self.max_gap:
+            return
+        self.update(np.array([float(last_heater), -1.0]), (temperature - last_temperature) / elapsed * 3600,
+                    forget=self._since_switch < self.forgetting_samples)
+
+    def update(self, x, y, forget=True):
+        forgetting = self.forgetting if forget else 1.0
+        px = self.covariance @ x
+        gain = px / (forgetting + x @ px)
+        self.theta = self.theta + gain * (y - x @ self.theta)
+        covariance = (self.covariance - np.outer(gain, px)) / forgetting
+        values, vectors = np.linalg.eigh((covariance + covariance.T) / 2)
+        if values[-1] > self.max_variance:
+            covariance = (vectors * np.minimum(values, self.max_variance)) @ vectors.T
+        self.covariance = covariance
+        self.samples += 1
+
+    @property
+    def ready(self):
+        """Whether enough samples have been seen and the heater has been seen to warm the room."""
+        return self.samples >= self.min_samples and self.warming_rate > 0
+
+    @property
+    def warming_rate(self):
+        """°C per hour with the heater on."""
+        return float(self.theta[0] - self.theta[1])
+
+    @property
+    def cooling_rate(self):
+        """°C per hour lost with the heater off."""
+        return float(self.theta[1])
+
+    def time_to_reach(self, temperature, target, max_seconds):
+        """Seconds of heating to get from temperature to target, at most max_seconds, 0 if the estimate isn't ready."""
+        if target <= temperature or not self.ready:
+            return 0.0
+        seconds = (target - temperature) / self.warming_rate * 3600
+        return min(seconds, max_seconds) if math.isfinite(seconds) else max_seconds
+
+    def to_dict(self):
+        return {
+            'warming_rate': round(self.warming_rate, 4),
+            'cooling_rate': round(self.cooling_rate, 4),
+            'samples': self.samples,
+            'ready': self.ready,
+        }
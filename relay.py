@@ -0,0 +1,20 @@
+from hardware import Relay
+
+
+class GPIORelay(Relay):
+    """Relay on a Raspberry Pi GPIO pin, numbered by board position."""
+
+    def __init__(self, pin=35, supress_warnings=True):
+        import RPi.GPIO as GPIO
+
+        self.GPIO = GPIO
+        self.pin = pin
+        GPIO.setwarnings(not supress_warnings)
+        GPIO.setmode(GPIO.BOARD)
+        GPIO.setup(self.pin, GPIO.OUT)
+
+    def set(self, state):
+        self.GPIO.output(self.pin, state)
+
+    def get(self):
+        return self.GPIO.input(self.pin)
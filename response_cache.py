@@ -0,0 +1,44 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Serialized response bodies, kept until the data they were built from changes. Each entry is stored with the version
+    of its source, a counter bumped on every change, and rebuilt on the first request after the version moves on, so
+    repeated polls in between cost a dictionary lookup instead of copying and serializing the data again.
+
+    The ETag is a hash of the body, so it stays strong across restarts, when the version counters start over.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version, render):
+        """Returns (body, etag) for key at version, calling render() for the body bytes if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        # Rendered outside the lock, the version was read before the data so at worst a newer body is stored under an
+        # older version and rendered once more on the next request
+        body = render()
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        with self._lock:
+            self._entries[key] = (version, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, etag
@@ -0,0 +1,112 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+class HistorySnapshot(NamedTuple):
+    temperature: np.ndarray  # float32
+    setpoint: np.ndarray  # float32
+    time: np.ndarray  # float64 epoch seconds
+    heater: np.ndarray  # uint8
+
+    def __len__(self):
+        return len(self.time)
+
+
+class HistoryBuffer:
+    """
+    Fixed capacity ring buffer holding the logged history as preallocated numpy columns.
+
+    Every sample is written twice, at i and i + size, so the most recent n samples always form one contiguous slice
+    and snapshots can be handed out as views without copying. One slack slot keeps the next append from landing
+    inside a full length view.
+
+    There is a single writer, the control loop, and readers take no lock. The head only moves once a sample is fully
+    written, so it doubles as the sequence counter of a seqlock: read() reruns a reader whose views were written over
+    while it was using them.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._size = capacity + 1
+        self._temperature = np.zeros(2 * self._size, dtype=np.float32)
+        self._setpoint = np.zeros(2 * self._size, dtype=np.float32)
+        self._time = np.zeros(2 * self._size, dtype=np.float64)
+        self._heater = np.zeros(2 * self._size, dtype=np.uint8)
+        self._head = 0  # total number of appends
+
+    def __len__(self):
+        return min(self._head, self.capacity)
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest sample, samples are numbered from 1 in the order they were appended."""
+        return self._head
+
+    @property
+    def first_seq(self):
+        """Sequence number of the oldest sample still in the buffer."""
+        return self._head - len(self) + 1
+
+    def append(self, temperature, setpoint, time, heater):
+        i = self._head % self._size
+        j = i + self._size
+        self._temperature[i] = self._temperature[j] = temperature
+        self._setpoint[i] = self._setpoint[j] = setpoint
+        self._time[i] = self._time[j] = time
+        self._heater[i] = self._heater[j] = heater
+        # Published last, readers never see a sample before all its columns are written
+        self._head += 1
+
+    def restore(self, seq, temperature, setpoint, time, heater):
+        """
+        Refills the buffer from persisted columns, oldest first, keeping their sequence numbers so cursors handed out
+        before a restart stay meaningful. seq is the sequence number of the last element.
+        """
+        n = min(len(time), self.capacity)
+        self._head = seq - n
+        for i in range(len(time) - n, len(time)):
+            self.append(temperature[i], setpoint[i], time[i], heater[i])
+
+    def snapshot(self, n=None):
+        """
+        Returns views over the last n samples (all of them by default), oldest first. The views stay valid until the
+        buffer wraps around them, so copy them if they need to outlive a request, or use them inside read().
+        """
+        head = self._head
+        count = min(head, self.capacity) if n is None else max(0, min(n, head, self.capacity))
+        return self._window(head, count)
+
+    def since(self, seq):
+        """
+        Returns (snapshot, cursor, reset) for the samples appended after sequence number seq. cursor is the sequence
+        number to pass next time. reset is True when seq has already fallen off the buffer (or comes from somewhere
+        else entirely), in which case the snapshot holds everything available and the client should start over.
+        """
+        head = self._head
+        available = min(head, self.capacity)
+        reset = not head - available <= seq <= head
+        count = available if reset else head - seq
+        return self._window(head, count), head, reset
+
+    def read(self, reader, *args):
+        """
+        Returns reader(*args), run again until it finishes without an append overwriting the snapshots it took. The
+        slack slot means a snapshot survives one append, so only a reader that spans two needs another go, and with
+        appends every log interval that's rare. reader must copy out of the views what it wants to keep.
+        """
+        while True:
+            head = self._head
+            result = reader(*args)
+            if self._head - head <= 1:
+                return result
+
+    def _window(self, head, count):
+        end = head % self._size + self._size
+        window = slice(end - count, end)
+        return HistorySnapshot(
+            temperature=self._temperature[window],
+            setpoint=self._setpoint[window],
+            time=self._time[window],
+            heater=self._heater[window],
+        )
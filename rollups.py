@@ -0,0 +1,219 @@
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+# (bucket width, number of buckets kept), both in seconds: 1 min for a week, 15 min for 90 days and 1 h for two years
+LEVELS = ((60, 7 * 24 * 60), (15 * 60, 90 * 24 * 4), (60 * 60, 2 * 365 * 24))
+
+# A source with up to this many times max_points points in range gets downsampled with LTTB instead of handing the
+# request to a coarser level, that keeps the shape of the curve at a cost proportional to the points returned
+LTTB_FACTOR = 8
+
+
+class Series(NamedTuple):
+    time: np.ndarray  # epoch seconds, start of the bucket for rollups
+    temperature: np.ndarray  # mean
+    minimum: np.ndarray
+    maximum: np.ndarray
+    setpoint: np.ndarray  # mean
+    duty: np.ndarray  # fraction of samples with the heater on
+
+    def __len__(self):
+        return len(self.time)
+
+    def take(self, index):
+        return Series(*(column[index] for column in self))
+
+    def to_dict(self):
+        return {
+            'time': self.time.tolist(),
+            'temperature': self.temperature.astype(float).round(4).tolist(),
+            'min': self.minimum.astype(float).round(4).tolist(),
+            'max': self.maximum.astype(float).round(4).tolist(),
+            'setpoint': self.setpoint.astype(float).round(2).tolist(),
+            'duty': self.duty.astype(float).round(4).tolist(),
+        }
+
+
+def lttb(series: Series, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last point and, from each of n_out - 2 equal
+    buckets in between, the point forming the largest triangle with the previously kept point and the next bucket's
+    average. Peaks and troughs survive, unlike plain decimation.
+    """
+    n = len(series)
+    if n_out >= n or n_out < 3:
+        return series
+    x = series.time
+    y = series.temperature.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return series.take(keep)
+
+
+class RollupLevel:
+    """
+    Fixed width time buckets with min/max/mean temperature, mean setpoint and heater duty cycle, kept in a ring of
+    preallocated columns. Like HistoryBuffer every bucket is mirrored at i and i + capacity, so any range of buckets
+    is one contiguous slice.
+    """
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self._start = np.zeros(2 * capacity, dtype=np.float64)
+        self._min = np.zeros(2 * capacity, dtype=np.float32)
+        self._max = np.zeros(2 * capacity, dtype=np.float32)
+        self._temperature_sum = np.zeros(2 * capacity, dtype=np.float64)
+        self._setpoint_sum = np.zeros(2 * capacity, dtype=np.float64)
+        self._heater_sum = np.zeros(2 * capacity, dtype=np.uint32)
+        self._count = np.zeros(2 * capacity, dtype=np.uint32)
+        self._head = 0  # total number of buckets opened
+        self._current = None  # start time of the newest bucket
+
+    def __len__(self):
+        return min(self._head, self.capacity)
+
+    def _columns(self):
+        return (self._start, self._min, self._max, self._temperature_sum, self._setpoint_sum, self._heater_sum,
+                self._count)
+
+    def _write(self, i, start, minimum, maximum, temperature_sum, setpoint_sum, heater_sum, count):
+        for column, value in zip(self._columns(),
+                                 (start, minimum, maximum, temperature_sum, setpoint_sum, heater_sum, count)):
+            column[i] = column[i + self.capacity] = value
+
+    def add(self, time, temperature, setpoint, heater):
+        start = time - time % self.width
+        if start != self._current:
+            i = self._head % self.capacity
+            self._write(i, start, temperature, temperature, temperature, setpoint, heater, 1)
+            self._head += 1
+            self._current = start
+            return
+        i = (self._head - 1) % self.capacity
+        self._write(
+            i,
+            start,
+            min(self._min[i], temperature),
+            max(self._max[i], temperature),
+            self._temperature_sum[i] + temperature,
+            self._setpoint_sum[i] + setpoint,
+            self._heater_sum[i] + heater,
+            self._count[i] + 1,
+        )
+
+    def load(self, time, temperature, setpoint, heater):
+        """Bulk load time sorted samples, one vectorized pass instead of an add() per sample."""
+        if len(time) == 0:
+            return
+        starts = time - time % self.width
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        temperature = temperature.astype(np.float64)
+        buckets = (
+            starts[first],
+            np.minimum.reduceat(temperature, first),
+            np.maximum.reduceat(temperature, first),
+            np.add.reduceat(temperature, first),
+            np.add.reduceat(setpoint.astype(np.float64), first),
+            np.add.reduceat(heater.astype(np.uint32), first),
+            np.diff(np.r_[first, len(time)]),
+        )
+        n = min(len(first), self.capacity)
+        index = (self._head + np.arange(n)) % self.capacity
+        for column, values in zip(self._columns(), buckets):
+            column[index] = column[index + self.capacity] = values[-n:]
+        self._head += n
+        self._current = buckets[0][-1]
+
+    def _window(self):
+        count = len(self)
+        end = self._head % self.capacity + self.capacity
+        return slice(end - count, end)
+
+    def oldest(self):
+        return self._start[self._window()][0] if len(self) else None
+
+    def count(self, start, end):
+        starts = self._start[self._window()]
+        return int(np.searchsorted(starts, end, side='left') - np.searchsorted(starts, start - self.width, side='right'))
+
+    def query(self, start, end):
+        """Buckets overlapping [start, end), oldest first."""
+        window = self._window()
+        starts = self._start[window]
+        lo = window.start + np.searchsorted(starts, start - self.width, side='right')
+        hi = window.start + np.searchsorted(starts, end, side='left')
+        count = self._count[lo:hi]
+        return Series(
+            time=self._start[lo:hi],
+            temperature=self._temperature_sum[lo:hi] / count,
+            minimum=self._min[lo:hi],
+            maximum=self._max[lo:hi],
+            setpoint=self._setpoint_sum[lo:hi] / count,
+            duty=self._heater_sum[lo:hi] / count,
+        )
+
+
+class Rollups:
+    """The rollup levels, all updated on every logged sample."""
+
+    def __init__(self, levels=LEVELS):
+        self.levels = [RollupLevel(width, capacity) for width, capacity in levels]
+        self.retention = max(width * capacity for width, capacity in levels)
+        self.first_time = None  # of the oldest sample ever seen
+        self._lock = threading.Lock()
+
+    def add(self, time, temperature, setpoint, heater):
+        with self._lock:
+            if self.first_time is None:
+                self.first_time = time
+            for level in self.levels:
+                level.add(time, temperature, setpoint, heater)
+
+    def load(self, time, temperature, setpoint, heater):
+        if len(time) == 0:
+            return
+        with self._lock:
+            self.first_time = time[0] if self.first_time is None else min(self.first_time, time[0])
+            for level in self.levels:
+                level.load(time, temperature, setpoint, heater)
+
+    def query(self, raw, start, end, max_points):
+        """
+        Returns (series, resolution) for [start, end) in at most max_points points. raw is the Series of full
+        resolution samples still in memory; resolution is None when those are used, else the bucket width in seconds.
+        The finest source that covers the range with at most LTTB_FACTOR * max_points points is picked and LTTB'd
+        down to max_points if needed.
+        """
+        budget = LTTB_FACTOR * max_points
+        with self._lock:
+            candidates = [level for level in self.levels if len(level)]
+            # Nothing can cover time before the first sample, don't let that rule out the finer sources
+            if self.first_time is not None:
+                start = max(start, self.first_time)
+
+            if len(raw) and raw.time[0] <= start:
+                lo, hi = np.searchsorted(raw.time, [start, end], side='left')
+                if hi - lo <= budget:
+                    return lttb(raw.take(slice(lo, hi)), max_points), None
+            if not candidates:
+                return raw.take(slice(0, 0)), None
+
+            covering = [level for level in candidates if level.oldest() <= start] or candidates[-1:]
+            level = next((level for level in covering if level.count(start, end) <= budget), covering[-1])
+            # Copy out of the ring before letting go of the lock, LTTB below only touches the copies
+            series = Series(*(np.array(column) for column in level.query(start, end)))
+        return lttb(series, max_points), level.width
@@ -1,2 +1,3 @@
 nohup python liveplot.py > frontend.log &
-nohup python backend.py > backend.log &
+# The backend keeps its own rotating log in backend.log, only warnings and crashes go to the console
+nohup python backend.py > backend.out 2>&1 &
@@ -0,0 +1,118 @@
+import logging
+import threading
+from time import monotonic, perf_counter
+from typing import NamedTuple
+
+from clock import SystemClock
+from metrics import I2C_BUCKETS, Histogram
+
+log = logging.getLogger(__name__)
+
+
+class Reading(NamedTuple):
+    value: float  # in degrees Celsius
+    read_time: float  # epoch seconds
+    monotonic_time: float
+    seq: int
+
+    def staleness(self, now=None):
+        return (monotonic() if now is None else now) - self.monotonic_time
+
+    def to_dict(self, now=None):
+        return {
+            'temperature': self.value,
+            'time': self.read_time,
+            'seq': self.seq,
+            'staleness': self.staleness(now),
+        }
+
+
+class SensorSampler:
+    """
+    Owns the temperature sensor and reads it at a fixed period on a background thread. Readers get the latest
+    published snapshot instead of touching the bus, so I2C traffic stays fixed no matter how many clients poll.
+    """
+
+    def __init__(self, sensor, period=2, clock=None):
+        self.sensor = sensor
+        self.period = period
+        self.clock = clock or SystemClock()
+        self.errors = 0
+        self.read_seconds = Histogram(I2C_BUCKETS)
+        self._latest = None
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        started = perf_counter()
+        value = self.sensor.read_temp()
+        self.read_seconds.observe(perf_counter() - started)
+        self._seq += 1
+        # Publishing is a single reference swap, readers never see a half-built snapshot
+        self._latest = Reading(value=value, read_time=self.clock.time(), monotonic_time=self.clock.monotonic(),
+                               seq=self._seq)
+        return self._latest
+
+    def latest(self):
+        return self._latest
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sensor-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def try_sample(self):
+        """sample(), but a failed bus read is counted and reported instead of raised."""
+        try:
+            return self.sample()
+        except OSError as e:
+            self.errors += 1
+            log.warning('Sensor read failed (%d total): %s', self.errors, e, extra={'event': 'read_failed'})
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.try_sample()
+            self._stop.wait(self.period)
+
+
+class SamplerGroup:
+    """
+    Drives several samplers from one thread: every period it makes a single pass over the sensors, reading them back to
+    back, instead of each sampler waking up and taking the bus on its own schedule.
+    """
+
+    def __init__(self, samplers, period=2):
+        self.samplers = list(samplers)
+        self.period = period
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        return [sampler.try_sample() for sampler in self.samplers]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sensor-sampler-group', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.period)
@@ -0,0 +1,90 @@
+import time as _time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+# 1970-01-01 was a Thursday, shift epoch seconds by this to count weeks from a Monday
+EPOCH_WEEKDAY_OFFSET = 3 * DAY
+
+
+class Transition(NamedTuple):
+    week_second: int  # seconds since Monday 00:00
+    setpoint: float
+    name: str
+
+
+def week_second(when: datetime):
+    return when.weekday() * DAY + when.hour * 3600 + when.minute * 60 + when.second
+
+
+class WeeklySchedule:
+    """
+    A schedule compiled down to a sorted table of (seconds into the week, setpoint) transitions. The setpoint in effect
+    at any moment is the last transition before it, wrapping around to the end of the previous week, found with a
+    bisect instead of checking every event.
+    """
+
+    def __init__(self, transitions):
+        # Sort by time, when two transitions land on the same second the one listed last wins
+        table = {}
+        for transition in transitions:
+            table[transition.week_second % WEEK] = transition
+        self.transitions = [table[second] for second in sorted(table)]
+        self.seconds = [transition.week_second for transition in self.transitions]
+        self._seconds = np.array(self.seconds, dtype=np.float64)
+        self._setpoints = np.array([transition.setpoint for transition in self.transitions], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def _index(self, second):
+        # -1 wraps around to the last transition of the previous week
+        return bisect_right(self.seconds, second) - 1
+
+    def active(self, when: datetime):
+        """The transition in effect at `when` and the datetime it took effect, or (None, None) for an empty schedule."""
+        if not self.transitions:
+            return None, None
+        second = week_second(when)
+        index = self._index(second)
+        transition = self.transitions[index]
+        elapsed = (second - transition.week_second) % WEEK
+        started = when.replace(microsecond=0) - timedelta(seconds=elapsed)
+        return transition, started
+
+    def setpoint_at(self, when: datetime):
+        transition, _ = self.active(when)
+        return None if transition is None else transition.setpoint
+
+    def next_transition(self, when: datetime):
+        """The next transition strictly after `when` and the datetime it happens, or (None, None)."""
+        if not self.transitions:
+            return None, None
+        second = week_second(when)
+        index = (self._index(second) + 1) % len(self.transitions)
+        transition = self.transitions[index]
+        remaining = (transition.week_second - second) % WEEK or WEEK
+        return transition, when.replace(microsecond=0) + timedelta(seconds=remaining)
+
+    def setpoints_at(self, timestamps):
+        """Vectorized lookup of the scheduled setpoint at each of the given epoch timestamps, in local time."""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if not self.transitions:
+            return np.full(timestamps.shape, np.nan)
+        if timestamps.size == 0:
+            return np.empty(timestamps.shape)
+        first, last = timestamps.min(), timestamps.max()
+        offset = _time.localtime(first).tm_gmtoff
+        if _time.localtime(last).tm_gmtoff == offset:
+            offsets = offset
+        else:
+            # The range crosses a DST change, look the offset up per timestamp
+            offsets = np.array([_time.localtime(t).tm_gmtoff for t in timestamps.ravel()]).reshape(timestamps.shape)
+        seconds = np.floor(timestamps + offsets + EPOCH_WEEKDAY_OFFSET) % WEEK
+        index = np.searchsorted(self._seconds, seconds, side='right') - 1
+        return self._setpoints[index]
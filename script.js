@@ -1,17 +1,34 @@
+// Needs wire.js loaded first, history is fetched in the packed column format
 window.addEventListener("load", function() {
     const apiUrl = 'http://localhost:1111';
     let temperatureData = [];
     let setpointData = [];
     let categories = [];
+    // Sequence number of the last sample we have, the backend only sends what was logged after it
+    let cursor = 0;
 
     function updateChartData() {
-        axios.get(`${apiUrl}/get_history`)
+        axios.get(`${apiUrl}/get_history`, {
+            params: { since: cursor },
+            headers: { 'Accept': WIRE_MEDIA_TYPE },
+            responseType: 'arraybuffer',
+        })
             .then(response => {
-                const data = response.data;
-                temperatureData = data.temperature;
-                setpointData = data.setpoint;
-                categories = temperatureData.map((_, index) => `Point ${index + 1}`);
-                updateChart();
+                const packed = decodeColumns(response.data);
+                const data = { ...packed, temperature: Array.from(packed.temperature), setpoint: Array.from(packed.setpoint) };
+                if (data.reset) {
+                    temperatureData = data.temperature;
+                    setpointData = data.setpoint;
+                } else if (data.temperature.length > 0) {
+                    temperatureData = temperatureData.concat(data.temperature).slice(-data.capacity);
+                    setpointData = setpointData.concat(data.setpoint).slice(-data.capacity);
+                }
+                const changed = data.reset || data.temperature.length > 0;
+                cursor = data.cursor;
+                if (changed) {
+                    categories = temperatureData.map((_, index) => `Point ${index + 1}`);
+                    updateChart();
+                }
             })
             .catch(error => {
                 if (error.response) {
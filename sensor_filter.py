@@ -0,0 +1,66 @@
+import statistics
+from collections import deque
+from time import sleep
+
+from hardware import Sensor
+
+SMOOTHING = (None, 'median', 'ema')
+
+
+class SensorFilter(Sensor):
+    """
+    Read pipeline in front of a sensor, so the controller switches on a clean signal instead of single raw samples:
+
+    - oversample: each read takes this many samples, spaced by the sensor's min_interval, and keeps their median.
+    - max_jump: a read more than this many °C away from the last output is rejected as an outlier and the last output
+      returned instead. After max_rejects rejections in a row the change is taken to be real and let through.
+    - smoothing: 'median' over the last `window` reads, or 'ema' with weight `alpha` on the newest read.
+    """
+
+    def __init__(self, sensor: Sensor, oversample=1, smoothing=None, window=5, alpha=0.3, max_jump=None,
+                 max_rejects=3):
+        if smoothing not in SMOOTHING:
+            raise ValueError(f'Unknown smoothing {smoothing!r}, expected one of {SMOOTHING}')
+        self.sensor = sensor
+        self.oversample = max(1, int(oversample))
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.max_jump = max_jump
+        self.max_rejects = max_rejects
+        self.min_interval = sensor.min_interval
+        self.rejected = 0  # outliers thrown away in total
+        self._consecutive_rejects = 0
+        self._window = deque(maxlen=window)
+        self._output = None
+
+    def __getattr__(self, name):
+        # Everything else, like the TMP75's address and settings, comes from the wrapped sensor
+        return getattr(self.sensor, name)
+
+    def read_raw(self):
+        samples = []
+        for i in range(self.oversample):
+            if i:
+                sleep(self.sensor.min_interval)
+            samples.append(self.sensor.read_temp())
+        return statistics.median(samples)
+
+    def read_temp(self):
+        value = self.read_raw()
+        if self.max_jump is not None and self._output is not None and abs(value - self._output) > self.max_jump:
+            self._consecutive_rejects += 1
+            if self._consecutive_rejects <= self.max_rejects:
+                self.rejected += 1
+                return self._output
+            # The jump has lasted, start over from the new level rather than smoothing towards it
+            self._window.clear()
+            self._output = None
+        self._consecutive_rejects = 0
+
+        if self.smoothing == 'median':
+            self._window.append(value)
+            value = statistics.median(self._window)
+        elif self.smoothing == 'ema' and self._output is not None:
+            value = self.alpha * value + (1 - self.alpha) * self._output
+        self._output = round(value, 4)
+        return self._output
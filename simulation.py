@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+
+from controller import TemperatureController, TemperatureSchedule
+from hardware import Relay
+from ringbuffer import HistoryBuffer
+from schedule import DAY
+from tmp75 import TMP75
+from zones import CONTROLLERS
+
+
+class VirtualClock:
+    """Stands in for SystemClock, sleeping just moves time forward."""
+
+    def __init__(self, start: datetime):
+        self._time = start.timestamp()
+        self._monotonic = 0.0
+
+    def time(self):
+        return self._time
+
+    def monotonic(self):
+        return self._monotonic
+
+    def now(self):
+        return datetime.fromtimestamp(self._time)
+
+    def sleep(self, seconds):
+        self._time += seconds
+        self._monotonic += seconds
+
+
+class SimulatedBus:
+    """
+    Stands in for smbus.SMBus behind an unmodified TMP75. The temperature register is encoded like the real part, as a
+    12 bit two's complement count of 0.0625°C steps truncated towards minus infinity, so readings come out quantized.
+    """
+
+    def __init__(self, temperature=20.0):
+        self.temperature = temperature
+        self.registers = {}
+
+    def read_i2c_block_data(self, address, register, length):
+        if register == TMP75.reg_temp:
+            raw = math.floor(self.temperature / 0.0625) & 0xFFF
+            return [raw >> 4, (raw & 0xF) << 4]
+        return list(self.registers.get((address, register), [0] * length))[:length]
+
+    def write_i2c_block_data(self, address, register, data):
+        self.registers[(address, register)] = list(data)
+
+
+class SimulatedRelay(Relay):
+    def __init__(self):
+        self.state = 0
+
+    def set(self, state):
+        self.state = int(state)
+
+    def get(self):
+        return self.state
+
+
+@dataclass
+class RoomModel:
+    """
+    First order thermal model: the room relaxes towards the outdoor temperature, plus heater_rise while the heater is
+    on, with time constant tau. The outdoor temperature follows a daily sine, coldest at 05:00.
+    """
+    tau: float = 4 * 60 * 60  # in seconds
+    heater_rise: float = 20.0  # °C above outdoor the room settles at with the heater on the whole time
+    outdoor_mean: float = 5.0
+    outdoor_swing: float = 4.0  # amplitude of the daily swing
+    initial_temperature: float = 18.0
+
+    def outdoor_temperature(self, local_time):
+        """local_time is epoch seconds shifted into the local timezone."""
+        phase = 2 * math.pi * ((local_time - 5 * 60 * 60) % DAY) / DAY
+        return self.outdoor_mean - self.outdoor_swing * math.cos(phase)
+
+    def step(self, temperature, heater, outdoor, dt):
+        # Exact solution of dT/dt = (outdoor + heater * heater_rise - T) / tau over dt with the inputs held
+        target = outdoor + heater * self.heater_rise
+        return target + (temperature - target) * math.exp(-dt / self.tau)
+
+
+@dataclass
+class SimulationResult:
+    controller: TemperatureController
+    # One entry per control tick, the true room temperature rather than the quantized reading
+    time: np.ndarray
+    temperature: np.ndarray
+    setpoint: np.ndarray
+    heater: np.ndarray
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def history(self) -> HistoryBuffer:
+        return self.controller.history
+
+
+def summarize(time, temperature, setpoint, heater, band=0.5):
+    dt = time[1] - time[0] if len(time) > 1 else 0.0
+    days = len(time) * dt / DAY
+    error = temperature - setpoint
+    starts = np.flatnonzero(np.diff(heater.astype(np.int8)) == 1) + 1
+    # Overshoot of each heating cycle: peak above setpoint between one turn on and the next
+    overshoot = np.maximum.reduceat(error, starts) if len(starts) else np.empty(0)
+    overshoot = np.clip(overshoot, 0, None)
+    return {
+        'days': days,
+        'relay_cycles': int(len(starts)),
+        'cycles_per_day': len(starts) / days if days else 0.0,
+        'heater_on_hours': float(heater.sum() * dt / 3600),
+        'max_overshoot': float(overshoot.max()) if len(overshoot) else 0.0,
+        'mean_overshoot': float(overshoot.mean()) if len(overshoot) else 0.0,
+        'hours_out_of_band': float((np.abs(error) > band).sum() * dt / 3600),
+        'rms_error': float(np.sqrt(np.mean(error ** 2))),
+    }
+
+
+@contextlib.contextmanager
+def quiet_logs():
+    """Drops info and debug records while a simulation runs, a heater switch every few virtual minutes adds up."""
+    previous = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(previous)
+
+
+def simulate(controller='hysteresis', days=30, room: RoomModel = None, update_time=2, start: datetime = None,
+             schedule: TemperatureSchedule = None, band=0.5, quiet=True, **kwargs):
+    """
+    Runs a controller against a simulated TMP75, relay and room in virtual time. The controller code runs unchanged,
+    only its sensor bus, relay and clock are swapped out. Extra keyword arguments go to the controller. With quiet
+    the controller's info and debug logs are dropped, warnings still come through.
+    """
+    room = room or RoomModel()
+    start = start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    controller_cls = CONTROLLERS[controller] if isinstance(controller, str) else controller
+
+    clock = VirtualClock(start)
+    bus = SimulatedBus(room.initial_temperature)
+    relay = SimulatedRelay()
+    n = int(days * DAY / update_time)
+    times = np.empty(n)
+    temperature = np.empty(n)
+    setpoint = np.empty(n)
+    heater = np.empty(n, dtype=np.uint8)
+    offset = time.localtime(clock.time()).tm_gmtoff
+
+    with quiet_logs() if quiet else contextlib.nullcontext():
+        instance = controller_cls(
+            sensor=TMP75(bus=bus),
+            relay=relay,
+            clock=clock,
+            config_file=None,
+            data_file=None,
+            update_time=update_time,
+            timespan=days * 24 * 60,
+            schedule=schedule or TemperatureSchedule(),
+            **kwargs,
+        )
+        temp = room.initial_temperature
+        for i in range(n):
+            instance.sampler.sample()
+            instance.tick()
+            now = clock.time()
+            times[i] = now
+            temperature[i] = temp
+            setpoint[i] = instance.setpoint
+            heater[i] = relay.state
+            temp = room.step(temp, relay.state, room.outdoor_temperature(now + offset), update_time)
+            bus.temperature = temp
+            clock.sleep(update_time)
+
+    return SimulationResult(
+        controller=instance,
+        time=times,
+        temperature=temperature,
+        setpoint=setpoint,
+        heater=heater,
+        stats=summarize(times, temperature, setpoint, heater, band=band),
+    )
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    args.add_argument('--controller', choices=sorted(CONTROLLERS), default='hysteresis')
+    args.add_argument('--days', type=float, default=30)
+    args.add_argument('--update_time', type=int, default=2)
+    args.add_argument('--default_setpoint', type=float, default=19.5)
+    args.add_argument('--hysteresis', type=float, default=0.25)
+    args.add_argument('--tau', type=float, default=4 * 60 * 60)
+    args.add_argument('--heater_rise', type=float, default=20.0)
+    args.add_argument('--outdoor_mean', type=float, default=5.0)
+    args.add_argument('--outdoor_swing', type=float, default=4.0)
+    args.add_argument('--band', type=float, default=0.5)
+    args.add_argument('--preheat', action='store_true', help='start heating early for scheduled raises')
+    args.add_argument('--verbose', action='store_true', help="show the controller's logs")
+    args = args.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+
+    controller_kwargs = {'default_setpoint': args.default_setpoint, 'preheat': args.preheat}
+    if args.controller == 'hysteresis':
+        controller_kwargs['hysteresis'] = args.hysteresis
+
+    started = time.perf_counter()
+    result = simulate(
+        controller=args.controller,
+        days=args.days,
+        room=RoomModel(tau=args.tau, heater_rise=args.heater_rise, outdoor_mean=args.outdoor_mean,
+                       outdoor_swing=args.outdoor_swing),
+        update_time=args.update_time,
+        band=args.band,
+        quiet=not args.verbose,
+        **controller_kwargs,
+    )
+    print(f'Simulated {args.days:g} days in {time.perf_counter() - started:.1f}s')
+    for key, value in result.stats.items():
+        print(f'{key}: {value:.3f}' if isinstance(value, float) else f'{key}: {value}')
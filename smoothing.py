@@ -0,0 +1,45 @@
+from collections import deque
+
+import numpy as np
+
+
+class StreamingSavgol:
+    """
+    Savitzky-Golay smoothing of a series that grows at the end, giving what savgol_filter(x, window, order) would over
+    everything seen so far while only doing work for the new points. A point is final once window // 2 points after it
+    have arrived, and costs one dot product over its window. The newest window // 2 points don't have that yet and are
+    evaluated on the polynomial fitted to the last window, as savgol_filter does at the edges, so they can still change
+    as more points arrive.
+    """
+
+    def __init__(self, window=15, order=3, capacity=None):
+        if window % 2 == 0 or order >= window:
+            raise ValueError('window must be odd and larger than order')
+        self.window = window
+        self.half = window // 2
+        positions = np.arange(window) - self.half
+        vandermonde = np.vander(positions, order + 1, increasing=True)
+        # Row i evaluates, at position i, the least squares polynomial through a window of values
+        self.fit = vandermonde @ np.linalg.pinv(vandermonde)
+        self.capacity = capacity
+        self.recent = deque(maxlen=window)
+        self.final = deque(maxlen=capacity)
+        self.count = 0
+
+    def extend(self, values):
+        for value in values:
+            self.recent.append(float(value))
+            self.count += 1
+            if self.count == self.window:
+                # The first points never get a centred window, they stay on the fit of the first one
+                self.final.extend((self.fit[:self.half] @ np.asarray(self.recent)).tolist())
+            if self.count >= self.window:
+                self.final.append(float(self.fit[self.half] @ np.asarray(self.recent)))
+
+    def values(self):
+        """The smoothed series, up to capacity points. Too short a series to fit is returned as it is."""
+        if self.count < self.window:
+            values = list(self.recent)
+        else:
+            values = list(self.final) + (self.fit[self.half + 1:] @ np.asarray(self.recent)).tolist()
+        return values[-self.capacity:] if self.capacity else values
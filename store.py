@@ -0,0 +1,171 @@
+import glob
+import logging
+import mmap
+import os
+import struct
+from time import monotonic
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'THRM'
+VERSION = 1
+
+# magic, version, record size, sequence number of the first record
+HEADER = struct.Struct('<4sHHQ')
+
+RECORD = struct.Struct('<QdffB3x')
+RECORD_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('time', '<f8'),
+    ('temperature', '<f4'),
+    ('setpoint', '<f4'),
+    ('heater', 'u1'),
+    ('pad', 'V3'),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+class SampleStore:
+    """
+    Append-only log of fixed size binary records, split into numbered segment files next to `path`
+    (path.000001, path.000002, ...). Records are only ever appended, never rewritten, which keeps SD card wear down.
+    Writes are fsynced every `fsync_interval` seconds and on rotation, so a crash loses at most that much data, and a
+    torn record at the end of the last segment is truncated away on open.
+    """
+
+    def __init__(self, path, segment_records=2 ** 16, max_segments=64, fsync_interval=60):
+        self.path = path
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.fsync_interval = fsync_interval
+        self._fd = None
+        self._segment_count = 0
+        self._last_sync = monotonic()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segments(self):
+        return sorted(glob.glob(glob.escape(self.path) + '.' + '[0-9]' * 6))
+
+    def _segment_path(self, index):
+        return f'{self.path}.{index:06d}'
+
+    @staticmethod
+    def _segment_index(segment):
+        return int(segment.rsplit('.', 1)[1])
+
+    def _recover(self):
+        segments = self._segments()
+        if not segments:
+            return
+        last = segments[-1]
+        size = os.path.getsize(last)
+        if size < HEADER.size:
+            # Crashed before the header made it to disk, nothing in there to keep
+            os.remove(last)
+            return
+        torn = (size - HEADER.size) % RECORD.size
+        if torn:
+            log.warning('Truncating %d bytes of a partially written record from %s', torn, last,
+                        extra={'event': 'truncate'})
+            os.truncate(last, size - torn)
+
+        # Power loss can also leave zero filled blocks at the end, sequence numbers start at 1 so those never held a
+        # real record
+        seq = self._read_segment(last)['seq']
+        count = len(seq)
+        while count and seq[count - 1] == 0:
+            count -= 1
+        if count < len(seq):
+            log.warning('Truncating %d empty records from %s', len(seq) - count, last, extra={'event': 'truncate'})
+            os.truncate(last, HEADER.size + count * RECORD.size)
+
+        self._fd = os.open(last, os.O_WRONLY | os.O_APPEND)
+        self._segment_count = count
+
+    def _open_segment(self, first_seq):
+        segments = self._segments()
+        index = self._segment_index(segments[-1]) + 1 if segments else 1
+        self._fd = os.open(self._segment_path(index), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, HEADER.pack(MAGIC, VERSION, RECORD.size, first_seq))
+        self._segment_count = 0
+
+        # Retention, drop whole segments from the front
+        for segment in segments[:max(0, len(segments) + 1 - self.max_segments)]:
+            os.remove(segment)
+
+    def _close_segment(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def append(self, seq, time, temperature, setpoint, heater):
+        if self._fd is None:
+            self._open_segment(seq)
+        elif self._segment_count >= self.segment_records:
+            self._close_segment()
+            self._open_segment(seq)
+        # One write per record, O_APPEND keeps it at the end even if something else touched the file
+        os.write(self._fd, RECORD.pack(seq, time, temperature, setpoint, heater))
+        self._segment_count += 1
+        if monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+        self._last_sync = monotonic()
+
+    def close(self):
+        self._close_segment()
+
+    @staticmethod
+    def _read_segment(segment):
+        """Maps a segment and copies its records out, so the map can be closed straight away."""
+        with open(segment, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                return np.empty(0, dtype=RECORD_DTYPE)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, record_size, _ = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                    raise ValueError(f'{segment} is not a v{VERSION} thermos segment')
+                count = (size - HEADER.size) // RECORD.size
+                return np.frombuffer(mm, dtype=RECORD_DTYPE, count=count, offset=HEADER.size).copy()
+
+    def tail(self, n):
+        """The last n records, oldest first."""
+        parts = []
+        remaining = n
+        for segment in reversed(self._segments()):
+            if remaining <= 0:
+                break
+            records = self._read_segment(segment)[-remaining:]
+            parts.append(records)
+            remaining -= len(records)
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts[::-1])
+
+    def read(self, start=None, end=None):
+        """All records with start <= time < end, oldest first."""
+        parts = []
+        for segment in self._segments():
+            records = self._read_segment(segment)
+            if len(records) == 0:
+                continue
+            if start is not None and records['time'][-1] < start:
+                continue
+            if end is not None and records['time'][0] >= end:
+                break
+            lo = 0 if start is None else np.searchsorted(records['time'], start, side='left')
+            hi = len(records) if end is None else np.searchsorted(records['time'], end, side='left')
+            parts.append(records[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
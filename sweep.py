@@ -0,0 +1,207 @@
+import argparse
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+from controller import TemperatureSchedule
+from schedule import DAY
+from simulation import CONTROLLERS, RoomModel
+
+QUANTUM = 0.0625  # TMP75 resolution in °C
+
+
+@dataclass
+class SweepResult:
+    controller: np.ndarray  # name of the policy
+    hysteresis: np.ndarray
+    schedule: np.ndarray  # index into the schedules passed in
+    room: np.ndarray  # index into the rooms passed in
+    cycles_per_day: np.ndarray
+    rms_error: np.ndarray
+    hours_out_of_band: np.ndarray
+    heater_on_hours: np.ndarray
+    max_overshoot: np.ndarray
+    mean_overshoot: np.ndarray
+
+    def __len__(self):
+        return len(self.hysteresis)
+
+    def score(self, cycle_cost=0.01):
+        """Comfort error plus a penalty of cycle_cost °C per relay cycle per day, lower is better."""
+        return self.rms_error + cycle_cost * self.cycles_per_day
+
+    def pareto(self):
+        """Configurations no other configuration of the same room beats on both cycles per day and comfort error."""
+        optimal = np.ones(len(self), dtype=bool)
+        for room in np.unique(self.room):
+            members = np.flatnonzero(self.room == room)
+            cycles = self.cycles_per_day[members]
+            error = self.rms_error[members]
+            dominated = ((cycles[None, :] <= cycles[:, None]) & (error[None, :] <= error[:, None]) &
+                         ((cycles[None, :] < cycles[:, None]) | (error[None, :] < error[:, None]))).any(axis=1)
+            optimal[members] = ~dominated
+        return optimal
+
+    def ranking(self, cycle_cost=0.01):
+        """Indices sorted by room, then score."""
+        return np.lexsort((self.score(cycle_cost), self.room))
+
+
+def sweep(hysteresis, schedules=None, rooms=None, controllers=('hysteresis',), days=7, update_time=2, band=0.5,
+          start: datetime = None):
+    """
+    Runs every combination of controller policy, hysteresis, schedule and room at once. Each control tick is a handful
+    of numpy operations over all combinations, using the controllers' batch_step, so the cost is the number of ticks,
+    nearly independent of how many configurations are evaluated. Mirrors simulation.simulate, including the sensor's
+    0.0625°C quantization, minus the per-object bookkeeping.
+    """
+    schedules = schedules or [TemperatureSchedule()]
+    rooms = rooms or [RoomModel()]
+    start = start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # Grouped by policy, so each policy's configurations are a contiguous slice
+    combos = [
+        (name, 0.0 if name == 'onoff' else h, s, r)
+        for name in controllers
+        for h, s, r in itertools.product(hysteresis if name != 'onoff' else [0.0], range(len(schedules)),
+                                         range(len(rooms)))
+    ]
+    policy = np.array([c[0] for c in combos])
+    h = np.array([c[1] for c in combos], dtype=np.float64)
+    schedule_index = np.array([c[2] for c in combos])
+    room_index = np.array([c[3] for c in combos])
+    n = len(combos)
+
+    tau = np.array([rooms[r].tau for r in room_index])
+    rise = np.array([rooms[r].heater_rise for r in room_index])
+    outdoor_mean = np.array([rooms[r].outdoor_mean for r in room_index])
+    outdoor_swing = np.array([rooms[r].outdoor_swing for r in room_index])
+    decay = np.exp(-update_time / tau)
+
+    steps = int(days * DAY / update_time)
+    times = start.timestamp() + update_time * np.arange(steps)
+    local = times + time.localtime(times[0]).tm_gmtoff
+    phase = np.cos(2 * np.pi * ((local - 5 * 60 * 60) % DAY) / DAY)
+    setpoints = np.stack([schedule.compile().setpoints_at(times) for schedule in schedules])
+    policies = [(CONTROLLERS[name], slice(np.flatnonzero(policy == name)[0], np.flatnonzero(policy == name)[-1] + 1))
+                for name in dict.fromkeys(policy)]
+
+    temp = np.array([rooms[r].initial_temperature for r in room_index], dtype=np.float64)
+    heater = np.zeros(n, dtype=np.uint8)
+    cycles = np.zeros(n)
+    on_ticks = np.zeros(n)
+    squared_error = np.zeros(n)
+    out_of_band = np.zeros(n)
+    peak = np.full(n, -np.inf)
+    started = np.zeros(n, dtype=bool)
+    overshoot_sum = np.zeros(n)
+    overshoot_count = np.zeros(n)
+    max_overshoot = np.zeros(n)
+    new_heater = np.empty(n, dtype=np.uint8)
+
+    for t in range(steps):
+        # A single schedule broadcasts as a scalar, much cheaper than a gather every tick
+        setpoint = setpoints[0, t] if len(schedules) == 1 else setpoints[schedule_index, t]
+        reading = (temp // QUANTUM) * QUANTUM
+        for controller_cls, members in policies:
+            new_heater[members] = controller_cls.batch_step(
+                reading[members],
+                setpoint if np.isscalar(setpoint) else setpoint[members],
+                heater[members],
+                h[members],
+            )
+        turned_on = new_heater > heater
+        heater[:] = new_heater
+
+        error = temp - setpoint
+        if turned_on.any():
+            # A new heating cycle starts, close the previous one's overshoot
+            closing = turned_on & started
+            finished = np.clip(peak, 0, None)
+            overshoot_sum += np.where(closing, finished, 0)
+            overshoot_count += closing
+            max_overshoot = np.where(closing, np.maximum(max_overshoot, finished), max_overshoot)
+            peak = np.where(turned_on, error, peak)
+            started |= turned_on
+            cycles += turned_on
+        peak = np.maximum(peak, error)
+        on_ticks += heater
+        error *= error
+        squared_error += error
+        out_of_band += error > band * band
+
+        target = outdoor_mean - outdoor_swing * phase[t] + heater * rise
+        temp = target + (temp - target) * decay
+
+    finished = np.clip(peak, 0, None)
+    overshoot_sum += np.where(started, finished, 0)
+    overshoot_count += started
+    max_overshoot = np.where(started, np.maximum(max_overshoot, finished), max_overshoot)
+
+    simulated_days = steps * update_time / DAY
+    return SweepResult(
+        controller=policy,
+        hysteresis=h,
+        schedule=schedule_index,
+        room=room_index,
+        cycles_per_day=cycles / simulated_days,
+        rms_error=np.sqrt(squared_error / steps),
+        hours_out_of_band=out_of_band * update_time / 3600,
+        heater_on_hours=on_ticks * update_time / 3600,
+        max_overshoot=max_overshoot,
+        mean_overshoot=np.divide(overshoot_sum, overshoot_count, out=np.zeros(n), where=overshoot_count > 0),
+    )
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser()
+    # Only stateless policies can be stepped for all configurations at once
+    args.add_argument('--controller', nargs='+', default=['hysteresis'],
+                      choices=sorted(name for name, cls in CONTROLLERS.items() if hasattr(cls, 'batch_step')))
+    args.add_argument('--hysteresis', type=float, nargs='+', default=[0.0625, 0.125, 0.25, 0.375, 0.5, 0.75, 1.0])
+    args.add_argument('--schedule', nargs='*', default=[], help='schedule JSON files, as returned by /get_schedule')
+    args.add_argument('--setpoint', type=float, nargs='*', default=[], help='constant setpoints to try as schedules')
+    args.add_argument('--tau', type=float, nargs='+', default=[4 * 60 * 60])
+    args.add_argument('--heater_rise', type=float, nargs='+', default=[20.0])
+    args.add_argument('--outdoor_mean', type=float, nargs='+', default=[5.0])
+    args.add_argument('--outdoor_swing', type=float, nargs='+', default=[4.0])
+    args.add_argument('--days', type=float, default=7)
+    args.add_argument('--update_time', type=int, default=2)
+    args.add_argument('--band', type=float, default=0.5)
+    args.add_argument('--cycle_cost', type=float, default=0.01, help='°C of comfort error one daily relay cycle is worth')
+    args.add_argument('--top', type=int, default=5, help='configurations to print per room')
+    args = args.parse_args()
+
+    schedules = []
+    for path in args.schedule:
+        schedule = TemperatureSchedule()
+        schedule.from_dict(json.load(open(path)))
+        schedules.append(schedule)
+    for setpoint in args.setpoint:
+        schedules.append(TemperatureSchedule(bedtime_temperature=setpoint, wakeup_temperature=setpoint,
+                                             at_work_temperature=setpoint))
+    rooms = [
+        RoomModel(tau=tau, heater_rise=rise, outdoor_mean=mean, outdoor_swing=swing)
+        for tau, rise, mean, swing in itertools.product(args.tau, args.heater_rise, args.outdoor_mean,
+                                                        args.outdoor_swing)
+    ]
+
+    started = time.perf_counter()
+    result = sweep(args.hysteresis, schedules=schedules, rooms=rooms, controllers=args.controller, days=args.days,
+                   update_time=args.update_time, band=args.band)
+    print(f'Evaluated {len(result)} configurations over {args.days:g} days in {time.perf_counter() - started:.1f}s')
+
+    optimal = result.pareto()
+    order = result.ranking(args.cycle_cost)
+    for room_index, room in enumerate(rooms):
+        print(f'\nRoom {room_index}: {room}')
+        print(f'{"controller":>10} {"hysteresis":>10} {"schedule":>8} {"cycles/day":>10} {"rms error":>9} '
+              f'{"out of band h":>13} {"heater h":>8} {"overshoot":>9} {"pareto":>6}')
+        for i in [i for i in order if result.room[i] == room_index][:args.top]:
+            print(f'{result.controller[i]:>10} {result.hysteresis[i]:>10.4f} {result.schedule[i]:>8} '
+                  f'{result.cycles_per_day[i]:>10.1f} {result.rms_error[i]:>9.3f} {result.hours_out_of_band[i]:>13.1f} '
+                  f'{result.heater_on_hours[i]:>8.1f} {result.mean_overshoot[i]:>9.3f} {"*" if optimal[i] else "":>6}')
@@ -0,0 +1,28 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import fakes  # noqa: E402
+
+# The backend's modules import smbus and RPi.GPIO, the benchmarks' stand-ins run them on any machine
+fakes.install()
+
+
+@pytest.fixture
+def london():
+    """Local time with DST, Europe/London went to BST on 2024-03-31 and back on 2024-10-27."""
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/London'
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = previous
+    time.tzset()
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from duty import PERIODS, DutyCycle, DutyPeriods, RelayJournal, _day, _hour
+
+
+def at(*args):
+    return datetime(*args).timestamp()
+
+
+def test_hour_bounds(london):
+    assert _hour(at(2024, 1, 1, 10, 0)) == (at(2024, 1, 1, 10), at(2024, 1, 1, 11))
+    assert _hour(at(2024, 1, 1, 10, 59, 59)) == (at(2024, 1, 1, 10), at(2024, 1, 1, 11))
+
+
+def test_day_bounds_follow_dst(london):
+    start, end = _day(at(2024, 3, 31, 12))
+    assert (start, end) == (at(2024, 3, 31), at(2024, 4, 1))
+    assert end - start == 23 * 3600
+    start, end = _day(at(2024, 10, 27, 12))
+    assert end - start == 25 * 3600
+
+
+def test_buckets_are_consecutive_across_gaps(london):
+    periods = DutyPeriods(_hour, 48)
+    periods.bucket(at(2024, 1, 1, 10, 30))
+    periods.bucket(at(2024, 1, 1, 14, 5))
+    starts = [bucket.start for bucket in periods.buckets]
+    assert starts == [at(2024, 1, 1, hour) for hour in range(10, 15)]
+    assert all(a.end == b.start for a, b in zip(periods.buckets, list(periods.buckets)[1:]))
+
+
+def test_a_long_gap_only_fills_what_is_kept(london):
+    periods = DutyPeriods(_hour, 5)
+    periods.bucket(at(2024, 1, 1, 0, 30))
+    periods.bucket(at(2024, 1, 5, 0, 30))
+    assert [bucket.start for bucket in periods.buckets] == [at(2024, 1, 4, hour) for hour in range(20, 24)] + \
+           [at(2024, 1, 5)]
+
+
+def test_a_time_before_the_newest_bucket_goes_into_it(london):
+    periods = DutyPeriods(_hour, 48)
+    newest = periods.bucket(at(2024, 1, 1, 10, 30))
+    assert periods.bucket(at(2024, 1, 1, 9, 30)) is newest
+
+
+def test_on_time_is_split_at_bucket_boundaries(london):
+    periods = DutyPeriods(_hour, 48)
+    periods.bucket(at(2024, 1, 1, 9, 50))
+    periods.add_on_time(at(2024, 1, 1, 9, 50), at(2024, 1, 1, 11, 15))
+    assert [bucket.on_seconds for bucket in periods.buckets] == [600, 3600, 900]
+
+
+def test_summary(london):
+    duty = DutyCycle()
+    duty.record(at(2024, 1, 1, 10, 0), 1)
+    duty.record(at(2024, 1, 1, 10, 15), 0)
+    duty.record(at(2024, 1, 1, 10, 30), 1)
+    duty.record(at(2024, 1, 1, 11, 10), 0)
+    duty.record(at(2024, 1, 1, 11, 40), 1)
+    # Still on at 11:50
+    latest, previous = duty.summary('hour', at(2024, 1, 1, 11, 50), count=2)
+    assert previous['on_seconds'] == 45 * 60
+    assert previous['duty'] == 0.75
+    assert previous['cycles'] == 2
+    assert previous['mean_on_seconds'] == 15 * 60
+    assert previous['mean_cycle_seconds'] == 30 * 60
+    # 10 minutes of the run that ended at 11:10, and 10 of the one in progress, over 50 minutes so far
+    assert latest['on_seconds'] == 20 * 60
+    assert latest['duty'] == 0.4
+    assert latest['cycles'] == 1
+    assert latest['mean_on_seconds'] == 40 * 60
+    assert latest['mean_cycle_seconds'] == 70 * 60
+
+    day, = duty.summary('day', at(2024, 1, 1, 11, 50))
+    assert day['on_seconds'] == 65 * 60
+    assert day['cycles'] == 3
+
+
+def test_repeated_states_are_ignored(london):
+    duty = DutyCycle()
+    duty.record(at(2024, 1, 1, 10, 0), 1)
+    duty.record(at(2024, 1, 1, 10, 5), 1)
+    duty.record(at(2024, 1, 1, 10, 10), 0)
+    duty.record(at(2024, 1, 1, 10, 20), 0)
+    hour, = duty.summary('hour', at(2024, 1, 1, 10, 30))
+    assert (hour['on_seconds'], hour['cycles']) == (600, 1)
+
+
+@pytest.mark.parametrize('period', sorted(PERIODS))
+def test_summary_count_is_capped(london, period):
+    duty = DutyCycle()
+    assert len(duty.summary(period, at(2024, 1, 1), count=1000)) == 1
+
+
+def test_journal_round_trip_and_torn_record(tmp_path):
+    path = str(tmp_path / 'transitions.dat')
+    journal = RelayJournal(capacity=3, path=path)
+    for i in range(5):
+        journal.write(journal.append(1000.0 + i, 19.0, i % 2))
+    assert journal.recent(10)['time'].tolist() == [1002.0, 1003.0, 1004.0]
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    reloaded = RelayJournal(capacity=3, path=path)
+    assert len(reloaded.load()) == 5
+    assert reloaded.recent(10)['time'].tolist() == [1002.0, 1003.0, 1004.0]
+    assert reloaded.last()['state'] == 0
@@ -0,0 +1,31 @@
+import asyncio
+
+from events import EventBroadcaster
+
+
+def test_stream_subscribes_once_iterated():
+    events = EventBroadcaster()
+    stream = events.stream(lambda: 'initial')
+    assert len(events) == 0
+    assert next(stream) == 'initial'
+    assert len(events) == 1
+    events.publish('reading', 1)
+    assert next(stream).startswith('event: reading')
+    stream.close()
+    assert len(events) == 0
+
+
+def test_stream_async_closed_unstarted_never_subscribes():
+    async def run():
+        events = EventBroadcaster()
+        stream = events.stream_async(lambda: 'initial')
+        await stream.aclose()
+        assert len(events) == 0
+
+        stream = events.stream_async(lambda: 'initial')
+        assert await stream.__anext__() == 'initial'
+        assert len(events) == 1
+        await stream.aclose()
+        assert len(events) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from controller import TemperatureSchedule
+from pid import PIDController
+from simulation import SimulatedBus, SimulatedRelay, VirtualClock, simulate
+from tmp75 import TMP75
+
+
+def make_pid(**kwargs):
+    return PIDController(sensor=TMP75(bus=SimulatedBus()), relay=SimulatedRelay(),
+                         clock=VirtualClock(datetime(2024, 1, 1)), config_file=None, data_file=None,
+                         schedule=TemperatureSchedule(), **kwargs)
+
+
+def run(pid, temperature, setpoint, seconds, step=10):
+    """control_step every `step` seconds, returns the relay state after each."""
+    states = []
+    for _ in range(int(seconds / step)):
+        pid.control_step(temperature, setpoint)
+        states.append(pid.relay.get())
+        pid.clock.sleep(step)
+    return states
+
+
+def test_integral_does_not_wind_up_while_saturated():
+    pid = make_pid(kp=1.0, ki=1 / 600, kd=0)
+    # Far below the setpoint for hours, the output is pinned at 1 and the integral must not keep growing
+    run(pid, 15.0, 20.0, 4 * 3600)
+    assert pid.output == 1
+    assert pid.i == 0
+    # So once the setpoint is reached the output drops straight away instead of overshooting for the integral's sake
+    pid.clock.sleep(pid.window)
+    run(pid, 20.1, 20.0, pid.window)
+    assert pid.output == 0
+    assert pid.relay.get() == 0
+
+
+def test_integral_stays_within_bounds():
+    pid = make_pid(kp=0.01, ki=1 / 60, kd=0)
+    run(pid, 19.0, 20.0, 4 * 3600)
+    assert 0 < pid.i <= 1
+    run(pid, 21.0, 20.0, 4 * 3600)
+    # It unwinds until the output reaches 0, never below
+    assert 0 <= pid.i <= 0.01
+
+
+def test_no_derivative_kick_on_setpoint_change():
+    pid = make_pid(kp=0, ki=0, kd=600)
+    run(pid, 19.5, 19.0, 600)
+    run(pid, 19.5, 21.0, 10)
+    assert pid.d == 0
+
+
+@pytest.mark.parametrize('error, on_seconds', [
+    (0.5, 150),  # half of a 300 s window
+    (0.3, 0),  # 90 s is shorter than min_on, dropped
+    (0.7, 300),  # a 90 s gap is shorter than min_off, on for the whole window
+])
+def test_pulses_shorter_than_min_on_or_off_are_dropped(error, on_seconds):
+    pid = make_pid(kp=1.0, ki=0, kd=0, window=300, min_on=120, min_off=120)
+    states = run(pid, 20.0 - error, 20.0, 300)
+    assert sum(states) * 10 == on_seconds
+
+
+def test_relay_is_not_switched_sooner_than_min_on_or_off():
+    pid = make_pid(window=300, min_on=120, min_off=120)
+    pid._switch(True, 0, 19.0, 20.0)
+    pid._switch(False, 60, 19.0, 20.0)
+    assert pid.relay.get() == 1
+    pid._switch(False, 120, 19.0, 20.0)
+    assert pid.relay.get() == 0
+    pid._switch(True, 200, 19.0, 20.0)
+    assert pid.relay.get() == 0
+    pid._switch(True, 240, 19.0, 20.0)
+    assert pid.relay.get() == 1
+
+
+def test_simulated_runs_respect_min_on_and_off():
+    result = simulate(controller='pid', days=3, update_time=10, min_on=180, min_off=240)
+    heater = result.heater.astype(int)
+    switches = np.flatnonzero(np.diff(heater)) + 1
+    assert len(switches) > 10
+    # Every run between two switches, each state's run length in seconds
+    lengths = np.diff(switches) * 10
+    states = heater[switches[:-1]]
+    assert lengths[states == 1].min() >= 180
+    assert lengths[states == 0].min() >= 240
@@ -0,0 +1,100 @@
+import numpy as np
+
+from ringbuffer import HistoryBuffer
+
+
+def filled(capacity, count):
+    buffer = HistoryBuffer(capacity)
+    for i in range(count):
+        buffer.append(temperature=i, setpoint=i + 0.5, time=1000.0 + i, heater=i % 2)
+    return buffer
+
+
+def test_snapshot_before_filling():
+    buffer = filled(5, 3)
+    snapshot = buffer.snapshot()
+    assert len(buffer) == len(snapshot) == 3
+    assert snapshot.time.tolist() == [1000.0, 1001.0, 1002.0]
+    assert snapshot.setpoint.tolist() == [0.5, 1.5, 2.5]
+
+
+def test_wraparound_keeps_the_newest_in_order():
+    buffer = filled(5, 13)
+    snapshot = buffer.snapshot()
+    assert len(buffer) == 5
+    assert snapshot.temperature.tolist() == [8, 9, 10, 11, 12]
+    assert snapshot.time.tolist() == [1008.0, 1009.0, 1010.0, 1011.0, 1012.0]
+    assert snapshot.heater.tolist() == [0, 1, 0, 1, 0]
+    assert (buffer.first_seq, buffer.last_seq) == (9, 13)
+
+
+def test_wraparound_at_every_offset():
+    buffer = HistoryBuffer(4)
+    for i in range(20):
+        buffer.append(i, 0, i, 0)
+        expected = list(range(max(0, i - 3), i + 1))
+        assert buffer.snapshot().temperature.tolist() == expected
+        assert buffer.snapshot(2).temperature.tolist() == expected[-2:]
+
+
+def test_snapshot_survives_one_append():
+    buffer = filled(5, 7)
+    snapshot = buffer.snapshot()
+    before = snapshot.temperature.copy()
+    buffer.append(100, 0, 2000.0, 0)
+    np.testing.assert_array_equal(snapshot.temperature, before)
+
+
+def test_snapshot_sizes():
+    buffer = filled(5, 8)
+    assert len(buffer.snapshot(0)) == 0
+    assert len(buffer.snapshot(-1)) == 0
+    assert buffer.snapshot(3).temperature.tolist() == [5, 6, 7]
+    assert len(buffer.snapshot(50)) == 5
+
+
+def test_restore_keeps_sequence_numbers():
+    buffer = HistoryBuffer(4)
+    values = np.arange(6, dtype=np.float64)
+    buffer.restore(60, values, values, values + 1000, np.zeros(6, dtype=np.uint8))
+    assert buffer.snapshot().temperature.tolist() == [2, 3, 4, 5]
+    assert (buffer.first_seq, buffer.last_seq) == (57, 60)
+    buffer.append(6, 6, 1006.0, 1)
+    assert buffer.last_seq == 61
+    assert buffer.snapshot().temperature.tolist() == [3, 4, 5, 6]
+
+
+def test_since_returns_only_new_samples():
+    buffer = filled(5, 3)
+    snapshot, cursor, reset = buffer.since(0)
+    assert (snapshot.temperature.tolist(), cursor, reset) == ([0, 1, 2], 3, False)
+    buffer.append(3, 0, 1003.0, 0)
+    buffer.append(4, 0, 1004.0, 0)
+    snapshot, cursor, reset = buffer.since(cursor)
+    assert (snapshot.temperature.tolist(), cursor, reset) == ([3, 4], 5, False)
+    snapshot, cursor, reset = buffer.since(cursor)
+    assert (len(snapshot), cursor, reset) == (0, 5, False)
+
+
+def test_since_across_the_wraparound():
+    buffer = filled(5, 9)
+    snapshot, cursor, reset = buffer.since(6)
+    assert (snapshot.temperature.tolist(), cursor, reset) == ([6, 7, 8], 9, False)
+    # The oldest sample still held is seq 5, a cursor of 4 has seen everything before it
+    snapshot, _, reset = buffer.since(4)
+    assert (snapshot.temperature.tolist(), reset) == ([4, 5, 6, 7, 8], False)
+
+
+def test_since_a_cursor_older_than_the_buffer_resets():
+    buffer = filled(5, 12)
+    snapshot, cursor, reset = buffer.since(3)
+    assert reset
+    assert cursor == 12
+    assert snapshot.temperature.tolist() == [7, 8, 9, 10, 11]
+
+
+def test_since_a_cursor_from_the_future_resets():
+    buffer = filled(5, 4)
+    snapshot, cursor, reset = buffer.since(40)
+    assert reset
+    assert (snapshot.temperature.tolist(), cursor) == ([0, 1, 2, 3], 4)
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from rollups import Rollups, RollupLevel, Series, lttb
+
+
+def series(n, start=0.0, step=40.0):
+    time = start + np.arange(n) * step
+    temperature = (20 + np.sin(np.arange(n) / 7)).astype(np.float32)
+    return Series(time=time, temperature=temperature, minimum=temperature, maximum=temperature,
+                  setpoint=np.full(n, 20.0, dtype=np.float32), duty=(np.arange(n) % 2).astype(np.uint8))
+
+
+@pytest.mark.parametrize('n, n_out', [(1000, 3), (1000, 10), (1000, 999), (101, 50), (7, 5)])
+def test_lttb_respects_max_points_and_keeps_endpoints(n, n_out):
+    raw = series(n)
+    out = lttb(raw, n_out)
+    assert len(out) == n_out
+    assert out.time[0] == raw.time[0]
+    assert out.time[-1] == raw.time[-1]
+    assert np.all(np.diff(out.time) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    raw = series(1000)
+    raw.temperature[437] = 40
+    assert 40 in lttb(raw, 20).temperature
+
+
+@pytest.mark.parametrize('n_out', [1, 2, 10, 20])
+def test_lttb_leaves_short_series_alone(n_out):
+    raw = series(10)
+    assert len(lttb(raw, n_out)) == 10
+
+
+def test_level_buckets():
+    level = RollupLevel(60, 10)
+    for t, temperature, heater in [(0, 18, 1), (30, 20, 0), (59, 22, 1), (60, 19, 0)]:
+        level.add(t, temperature, 20, heater)
+    out = level.query(0, 120)
+    assert out.time.tolist() == [0, 60]
+    assert out.temperature.tolist() == [20, 19]
+    assert (out.minimum.tolist(), out.maximum.tolist()) == ([18, 19], [22, 19])
+    assert out.duty.tolist() == pytest.approx([2 / 3, 0])
+
+
+def test_level_load_matches_add():
+    raw = series(500, start=1000.0, step=17.0)
+    added, loaded = RollupLevel(60, 50), RollupLevel(60, 50)
+    for t, temperature, setpoint, heater in zip(raw.time, raw.temperature, raw.setpoint, raw.duty):
+        added.add(t, temperature, setpoint, heater)
+    loaded.load(raw.time, raw.temperature, raw.setpoint, raw.duty)
+    for a, b in zip(added.query(0, 1e9), loaded.query(0, 1e9)):
+        np.testing.assert_allclose(a, b, rtol=1e-6)
+    assert len(added) == 50
+
+
+def make_rollups(n, step=40.0):
+    raw = series(n, step=step)
+    rollups = Rollups(levels=((60, 1000), (15 * 60, 1000), (3600, 1000)))
+    rollups.load(raw.time, raw.temperature, raw.setpoint, raw.duty)
+    return raw, rollups
+
+
+@pytest.mark.parametrize('n, max_points', [(20, 3), (2000, 250), (2000, 500), (2000, 5000)])
+def test_query_from_raw_respects_max_points(n, max_points):
+    # Raw samples are used as long as there are at most 8 times max_points of them in range
+    raw, rollups = make_rollups(n)
+    out, resolution = rollups.query(raw, 0, raw.time[-1] + 1, max_points)
+    assert resolution is None
+    assert len(out) == min(max_points, len(raw))
+    assert (out.time[0], out.time[-1]) == (raw.time[0], raw.time[-1])
+
+
+@pytest.mark.parametrize('max_points', [3, 20, 100])
+def test_query_from_rollups_respects_max_points(max_points):
+    raw, rollups = make_rollups(20000)
+    # Only the last few raw samples are still in memory, the range goes back further than that
+    recent = raw.take(slice(-100, None))
+    out, resolution = rollups.query(recent, 0, raw.time[-1] + 1, max_points)
+    assert resolution is not None
+    assert len(out) <= max_points
+    # The endpoints are the first and last bucket of the range
+    assert out.time[0] == 0
+    assert out.time[-1] == raw.time[-1] - raw.time[-1] % resolution
+
+
+def test_query_picks_the_finest_level_that_fits():
+    raw, rollups = make_rollups(20000)
+    recent = raw.take(slice(-100, None))
+    end = raw.time[-1] + 1
+    # 2 hours of 1 minute buckets fit in a budget of 8 * 20
+    _, resolution = rollups.query(recent, end - 2 * 3600, end, 20)
+    assert resolution == 60
+    _, resolution = rollups.query(recent, 0, end, 20)
+    assert resolution == 3600
+
+
+def test_restore_runs_in_the_background_and_keeps_samples_logged_meanwhile(tmp_path):
+    import threading
+    from datetime import datetime
+
+    from controller import TemperatureSchedule
+    from hysteresis import HysteresisController
+    from simulation import SimulatedBus, SimulatedRelay, VirtualClock
+    from store import SampleStore
+    from tmp75 import TMP75
+
+    clock = VirtualClock(datetime(2024, 1, 10))
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path)
+    now = clock.time()
+    for seq in range(1, 101):
+        store.append(seq, now - 3600 * (101 - seq), 18.0, 20.0, 1)
+    store.close()
+
+    controller = HysteresisController(sensor=TMP75(bus=SimulatedBus()), relay=SimulatedRelay(), clock=clock,
+                                      config_file=None, data_file=path, schedule=TemperatureSchedule())
+    release = threading.Event()
+    read = controller.store.read
+    controller.store.read = lambda **kwargs: release.wait() and read(**kwargs)
+
+    thread = controller.restore_rollups()
+    assert thread.is_alive()
+    controller.log_sample(21.0, 20.0)
+    release.set()
+    thread.join(5)
+
+    hourly = controller.rollups.levels[-1].query(now - 200 * 3600, now + 3600)
+    # The stored hours, then the current one holding the sample logged during the rebuild
+    assert len(hourly) == 101
+    assert hourly.temperature[:100].tolist() == [18.0] * 100
+    assert hourly.maximum[-1] == 21.0
+    assert controller._rollups_pending is None
@@ -0,0 +1,49 @@
+import pytest
+
+from controller import TemperatureSchedule
+
+
+def from_dict(data):
+    schedule = TemperatureSchedule()
+    schedule.from_dict(data)
+    return schedule
+
+
+def test_valid_event_is_compiled():
+    schedule = from_dict({'events': [{'days': [0, 6], 'time': '12:00', 'temperature': '19.5', 'name': 'Lunch'}]})
+    assert schedule.events == [{'days': [0, 6], 'time': '12:00', 'temperature': 19.5, 'name': 'Lunch'}]
+    seconds = {transition.week_second for transition in schedule.compile().transitions if transition.name == 'Lunch'}
+    assert seconds == {12 * 3600, 6 * 86400 + 12 * 3600}
+
+
+@pytest.mark.parametrize('event', [
+    {'temperature': 19.0},
+    {'time': '07:00'},
+    {'time': '25:00', 'temperature': 19.0},
+    {'time': 'seven', 'temperature': 19.0},
+    {'time': 700, 'temperature': 19.0},
+    {'time': '07:00', 'temperature': 30},
+    {'time': '07:00', 'temperature': 5},
+    {'time': '07:00', 'temperature': 'warm'},
+    {'time': '07:00', 'temperature': True},
+    {'time': '07:00', 'temperature': 19.0, 'days': [7]},
+    {'time': '07:00', 'temperature': 19.0, 'days': [-1]},
+    {'time': '07:00', 'temperature': 19.0, 'days': ['monday']},
+    {'time': '07:00', 'temperature': 19.0, 'days': 1},
+    'at seven',
+])
+def test_bad_event_is_rejected(event):
+    with pytest.raises(ValueError):
+        from_dict({'events': [event]})
+
+
+@pytest.mark.parametrize('data', [
+    {'wakeup_temperature': 30},
+    {'bedtime_temperature': 'cold'},
+    {'weekday_bedtime': '23:61'},
+    {'events': {'time': '07:00', 'temperature': 19.0}},
+    None,
+])
+def test_bad_schedule_is_rejected(data):
+    with pytest.raises(ValueError):
+        from_dict(data)
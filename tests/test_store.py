@@ -0,0 +1,103 @@
+import os
+
+from store import HEADER, RECORD, SampleStore
+
+
+def write(store, seqs):
+    for seq in seqs:
+        store.append(seq, 1000.0 + seq, 19.0 + seq / 100, 20.0, seq % 2)
+
+
+def test_records_round_trip(tmp_path):
+    store = SampleStore(str(tmp_path / 'history.dat'))
+    write(store, range(1, 6))
+    store.close()
+    records = SampleStore(str(tmp_path / 'history.dat')).tail(10)
+    assert records['seq'].tolist() == [1, 2, 3, 4, 5]
+    assert records['time'].tolist() == [1001.0, 1002.0, 1003.0, 1004.0, 1005.0]
+    assert records['heater'].tolist() == [1, 0, 1, 0, 1]
+
+
+def test_torn_last_record_is_truncated(tmp_path):
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path)
+    write(store, range(1, 4))
+    store.close()
+    segment = path + '.000001'
+    with open(segment, 'ab') as f:
+        f.write(RECORD.pack(4, 1004.0, 19.0, 20.0, 0)[:11])
+
+    store = SampleStore(path)
+    assert os.path.getsize(segment) == HEADER.size + 3 * RECORD.size
+    # Appends carry on from the last whole record
+    write(store, [4])
+    store.close()
+    assert SampleStore(path).tail(10)['seq'].tolist() == [1, 2, 3, 4]
+
+
+def test_zero_filled_tail_is_truncated(tmp_path):
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path)
+    write(store, range(1, 3))
+    store.close()
+    with open(path + '.000001', 'ab') as f:
+        f.write(b'\0' * 3 * RECORD.size)
+    assert SampleStore(path).tail(10)['seq'].tolist() == [1, 2]
+
+
+def test_segment_without_a_header_is_dropped(tmp_path):
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path, segment_records=2)
+    write(store, range(1, 4))
+    store.close()
+    with open(path + '.000003', 'wb') as f:
+        f.write(b'TH')
+    store = SampleStore(path, segment_records=2)
+    assert not os.path.exists(path + '.000003')
+    assert store.tail(10)['seq'].tolist() == [1, 2, 3]
+
+
+def test_segments_rotate(tmp_path):
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path, segment_records=3)
+    write(store, range(1, 8))
+    store.close()
+    assert [os.path.basename(segment) for segment in store._segments()] == \
+           ['history.dat.000001', 'history.dat.000002', 'history.dat.000003']
+    assert os.path.getsize(path + '.000001') == HEADER.size + 3 * RECORD.size
+    assert os.path.getsize(path + '.000003') == HEADER.size + RECORD.size
+    # Each segment's header holds the sequence number of its first record
+    with open(path + '.000002', 'rb') as f:
+        assert HEADER.unpack(f.read(HEADER.size))[3] == 4
+    assert store.tail(5)['seq'].tolist() == [3, 4, 5, 6, 7]
+
+
+def test_rotation_after_reopening_continues_the_segment(tmp_path):
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path, segment_records=3)
+    write(store, range(1, 3))
+    store.close()
+    store = SampleStore(path, segment_records=3)
+    write(store, range(3, 5))
+    store.close()
+    assert len(store._segments()) == 2
+    assert store.tail(10)['seq'].tolist() == [1, 2, 3, 4]
+
+
+def test_retention_drops_the_oldest_segments(tmp_path):
+    path = str(tmp_path / 'history.dat')
+    store = SampleStore(path, segment_records=2, max_segments=3)
+    write(store, range(1, 11))
+    store.close()
+    assert [os.path.basename(segment) for segment in store._segments()] == \
+           ['history.dat.000003', 'history.dat.000004', 'history.dat.000005']
+    assert store.read()['seq'].tolist() == [5, 6, 7, 8, 9, 10]
+
+
+def test_read_time_range_across_segments(tmp_path):
+    store = SampleStore(str(tmp_path / 'history.dat'), segment_records=3)
+    write(store, range(1, 11))
+    store.close()
+    assert store.read(1003.0, 1008.0)['seq'].tolist() == [3, 4, 5, 6, 7]
+    assert store.read(start=1009.5)['seq'].tolist() == [10]
+    assert len(store.read(2000.0)) == 0
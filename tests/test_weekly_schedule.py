@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from controller import TemperatureSchedule
+from schedule import DAY, Transition, WeeklySchedule
+
+# Monday 07:00 and 22:00, Sunday 23:00
+SCHEDULE = WeeklySchedule([
+    Transition(7 * 3600, 20.0, 'Waking up'),
+    Transition(22 * 3600, 17.0, 'Bedtime'),
+    Transition(6 * DAY + 23 * 3600, 15.0, 'Sunday night'),
+])
+MONDAY = datetime(2024, 1, 1)
+
+
+def test_active_within_the_week():
+    transition, started = SCHEDULE.active(MONDAY.replace(hour=12, minute=30, second=15, microsecond=5))
+    assert transition.name == 'Waking up'
+    assert started == MONDAY.replace(hour=7)
+
+
+def test_active_wraps_to_the_end_of_the_previous_week():
+    transition, started = SCHEDULE.active(MONDAY.replace(hour=3))
+    assert transition.name == 'Sunday night'
+    assert started == MONDAY - timedelta(hours=1)
+
+
+def test_active_on_a_transition():
+    transition, started = SCHEDULE.active(MONDAY.replace(hour=22))
+    assert (transition.name, started) == ('Bedtime', MONDAY.replace(hour=22))
+
+
+def test_next_transition_across_the_week_boundary():
+    sunday = MONDAY + timedelta(days=6, hours=23, minutes=30)
+    transition, when = SCHEDULE.next_transition(sunday)
+    assert transition.name == 'Waking up'
+    assert when == MONDAY + timedelta(days=7, hours=7)
+
+
+def test_next_transition_is_strictly_after():
+    transition, when = SCHEDULE.next_transition(MONDAY.replace(hour=7))
+    assert (transition.name, when) == ('Bedtime', MONDAY.replace(hour=22))
+
+
+def test_single_transition_comes_round_a_week_later():
+    schedule = WeeklySchedule([Transition(3600, 18.0, 'Only')])
+    _, when = schedule.next_transition(MONDAY.replace(hour=1))
+    assert when == MONDAY.replace(hour=1) + timedelta(days=7)
+
+
+def test_empty_schedule():
+    schedule = WeeklySchedule([])
+    assert schedule.active(MONDAY) == (None, None)
+    assert schedule.next_transition(MONDAY) == (None, None)
+    assert np.isnan(schedule.setpoints_at([0.0])).all()
+
+
+def test_last_listed_wins_on_the_same_second():
+    schedule = WeeklySchedule([Transition(3600, 18.0, 'First'), Transition(3600, 19.0, 'Second')])
+    assert schedule.setpoint_at(MONDAY.replace(hour=2)) == 19.0
+
+
+def test_next_transition_across_dst(london):
+    # The clocks go forward at 01:00 on Sunday 2024-03-31, the 09:00 wake up is still at 09:00 local time
+    compiled = TemperatureSchedule().compile()
+    saturday_night = datetime(2024, 3, 30, 23, 59, 30)
+    transition, when = compiled.next_transition(saturday_night)
+    assert (transition.name, when) == ('Waking up', datetime(2024, 3, 31, 9, 0))
+    # Only 8 hours of real time away, not 9
+    assert when.timestamp() - saturday_night.timestamp() == 8 * 3600 + 30
+
+
+@pytest.mark.parametrize('start', [datetime(2024, 3, 29), datetime(2024, 10, 25)])
+def test_setpoints_at_matches_active_across_dst(london, start):
+    compiled = TemperatureSchedule().compile()
+    timestamps = start.timestamp() + np.arange(0, 4 * DAY, 600.0)
+    expected = [compiled.setpoint_at(datetime.fromtimestamp(t)) for t in timestamps]
+    np.testing.assert_array_equal(compiled.setpoints_at(timestamps), expected)
@@ -0,0 +1,77 @@
+import struct
+
+import numpy as np
+import pytest
+
+import wire
+
+
+def columns(times):
+    n = len(times)
+    return [
+        ('temperature', wire.FLOAT32, np.linspace(18, 21, n)),
+        ('heater', wire.UINT8, np.arange(n) % 2),
+        ('time', wire.TIME, times),
+    ]
+
+
+def column_kinds(data):
+    (meta_length,) = struct.unpack_from('<I', data, 4)
+    offset = 8 + meta_length + (-meta_length % 4)
+    _, count = struct.unpack_from('<IB', data, offset)
+    offset += 5
+    kinds = {}
+    for _ in range(count):
+        length = data[offset]
+        kinds[data[offset + 1:offset + 1 + length].decode()] = data[offset + 1 + length]
+        offset += length + 2
+    return kinds
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 5, 2161])
+def test_round_trip(n):
+    times = 1.7e9 + np.arange(n) * 40.0 + 0.25
+    data = wire.encode(columns(times), {'cursor': 12, 'reset': False})
+    assert len(data) % 4 == 0
+    decoded = wire.decode(data)
+    assert (decoded['cursor'], decoded['reset']) == (12, False)
+    np.testing.assert_allclose(decoded['time'], times)
+    np.testing.assert_allclose(decoded['temperature'], np.linspace(18, 21, n), rtol=1e-6)
+    assert decoded['heater'].tolist() == (np.arange(n) % 2).tolist()
+    assert column_kinds(data)['time'] == wire.TIME
+
+
+def test_times_are_rounded_to_milliseconds_without_drift():
+    times = 1.7e9 + np.arange(1000) * 40.0004
+    decoded = wire.decode(wire.encode([('time', wire.TIME, times)]))
+    assert np.abs(decoded['time'] - times).max() <= 0.0005
+
+
+@pytest.mark.parametrize('gap_days', [24.8, 25, 40, 400])
+def test_long_gaps_round_trip(gap_days):
+    times = np.array([1.7e9, 1.7e9 + 40, 1.7e9 + 40 + gap_days * 86400, 1.7e9 + 80 + gap_days * 86400])
+    data = wire.encode(columns(times))
+    decoded = wire.decode(data)
+    np.testing.assert_allclose(decoded['time'], times)
+    assert decoded['heater'].tolist() == [0, 1, 0, 1]
+    assert column_kinds(data)['time'] == (wire.TIME if gap_days < 24.85 else wire.TIME_WIDE)
+
+
+def test_backwards_gap_round_trips():
+    times = np.array([1.7e9 + 40 * 86400, 1.7e9])
+    np.testing.assert_allclose(wire.decode(wire.encode([('time', wire.TIME, times)]))['time'], times)
+
+
+def test_mismatched_columns_are_refused():
+    with pytest.raises(ValueError):
+        wire.encode([('a', wire.FLOAT32, [1.0, 2.0]), ('b', wire.FLOAT32, [1.0])])
+
+
+def test_unknown_kind_is_refused():
+    with pytest.raises(ValueError):
+        wire.encode([('a', 9, [1.0])])
+
+
+def test_not_a_payload():
+    with pytest.raises(ValueError):
+        wire.decode(b'{"time": []}')
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+from clock import SystemClock
+from metrics import TICK_BUCKETS, Histogram
+
+
+class TickStats:
+    def __init__(self):
+        self.ticks = 0
+        self.overruns = 0  # ticks that ran past the following deadline
+        self.skipped = 0  # deadlines dropped without a tick
+        self.last_jitter = 0.0  # how late the last tick started, in seconds
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.jitter_seconds = Histogram(TICK_BUCKETS)
+        self.duration_seconds = Histogram(TICK_BUCKETS)
+
+    def record(self, jitter, duration):
+        self.jitter_seconds.observe(jitter)
+        self.duration_seconds.observe(duration)
+        self.ticks += 1
+        self.last_jitter = jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        self.total_jitter += jitter
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+
+    def to_dict(self):
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'last_jitter': self.last_jitter,
+            'max_jitter': self.max_jitter,
+            'mean_jitter': self.total_jitter / self.ticks if self.ticks else 0.0,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+        }
+
+
+class Ticker:
+    """
+    Calls a function on absolute deadlines of the monotonic clock, start + n * period, so neither the time spent in the
+    function nor the sleep waking up late adds up into drift.
+
+    When a tick runs past the following deadlines the policy decides what happens to them. 'skip' drops them and waits
+    for the next deadline still ahead, so ticks stay on the grid. 'catch_up' runs them back to back, so the number of
+    ticks keeps matching elapsed time, but only up to max_catch_up of them, anything beyond that is skipped.
+    """
+    POLICIES = ('skip', 'catch_up')
+
+    def __init__(self, period, clock=None, policy='skip', max_catch_up=5):
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown missed tick policy {policy!r}, expected one of {self.POLICIES}')
+        self.period = period
+        self.clock = clock or SystemClock()
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.stats = TickStats()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, callback):
+        self._stop.clear()
+        deadline = self.clock.monotonic()
+        while not self._stop.is_set():
+            now = self.clock.monotonic()
+            if now < deadline:
+                self.clock.sleep(deadline - now)
+            deadline = self._tick(callback, deadline)
+
+    async def run_async(self, callback):
+        """run() as an asyncio task, the waits between ticks go back to the event loop."""
+        self._stop.clear()
+        deadline = self.clock.monotonic()
+        while not self._stop.is_set():
+            # Even when catching up, let whatever else is waiting on the loop have a turn between ticks
+            await asyncio.sleep(max(0.0, deadline - self.clock.monotonic()))
+            deadline = self._tick(callback, deadline)
+
+    def _tick(self, callback, deadline):
+        """Runs one tick due at deadline and returns the deadline of the next one."""
+        now = self.clock.monotonic()
+        callback()
+        self.stats.record(now - deadline, self.clock.monotonic() - now)
+
+        deadline += self.period
+        behind = self.clock.monotonic() - deadline
+        if behind <= 0:
+            return deadline
+        self.stats.overruns += 1
+        # Deadlines already passed, counting the one just missed
+        missed = int(behind // self.period) + 1
+        keep = 0 if self.policy == 'skip' else min(missed, self.max_catch_up)
+        self.stats.skipped += missed - keep
+        return deadline + (missed - keep) * self.period
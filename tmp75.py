@@ -1,30 +1,74 @@
-import smbus
+from functools import lru_cache
+from time import sleep
 
+from hardware import Sensor
 
-class TMP75:
+
+@lru_cache(maxsize=None)
+def shared_bus(channel):
+    """One SMBus per I2C channel for the whole process, however many sensors sit on it."""
+    import smbus
+    return smbus.SMBus(channel)
+
+
+class TMP75(Sensor):
     i2c_ch = 1
 
-    # TMP102 address on the I2C bus
+    # TMP75 address on the I2C bus
     i2c_address = 0x48
 
     # Register addresses
     reg_temp = 0x00
     reg_config = 0x01
 
-    def __init__(self):
-        self.bus = smbus.SMBus(self.i2c_ch)
+    # Config register bits
+    config_os = 1 << 7  # one-shot: starts a conversion while shut down
+    config_resolution_shift = 5  # R1 R0 at bits 6:5
+    config_sd = 1 << 0  # shutdown
+
+    # Resolution in bits -> (R1 R0, typical and maximum conversion time in seconds)
+    resolutions = {
+        9: (0b00, 0.0275, 0.0375),
+        10: (0b01, 0.055, 0.075),
+        11: (0b10, 0.11, 0.15),
+        12: (0b11, 0.22, 0.3),
+    }
 
-        val = self.bus.read_i2c_block_data(self.i2c_address, self.reg_config, 2)
+    def __init__(self, bus=None, address=None, resolution=12, one_shot=False):
+        """
+        resolution is 9 to 12 bits, 0.5°C down to 0.0625°C steps, each bit doubling the conversion time. With one_shot
+        the sensor stays shut down and converts once per read instead of continuously, which keeps it from
+        self-heating and idles it between the controller's reads.
+        """
+        if resolution not in self.resolutions:
+            raise ValueError(f'Resolution must be one of {sorted(self.resolutions)} bits, got {resolution}')
+        self.bus = bus if bus is not None else shared_bus(self.i2c_ch)
+        if address is not None:
+            self.i2c_address = address
+        self.resolution = resolution
+        self.one_shot = one_shot
+        bits, self.conversion_time, self.max_conversion_time = self.resolutions[resolution]
+        # In continuous mode a new value only shows up once per conversion
+        self.min_interval = 0.0 if one_shot else self.conversion_time
 
-        # Set to 4 Hz sampling (CR1, CR0 = 0b10)
-        val[1] = val[1] & 0b00111111
-        val[1] = val[1] | (0b10 << 6)
+        # The config register is a single byte, the alert bits (F1 F0, POL, TM) are left as they are
+        config = self.read_config()
+        config &= ~(self.config_os | (0b11 << self.config_resolution_shift) | self.config_sd) & 0xFF
+        config |= bits << self.config_resolution_shift
+        if one_shot:
+            config |= self.config_sd
+        self.config = config
+        self.bus.write_i2c_block_data(self.i2c_address, self.reg_config, [config])
 
-        # Write 4 Hz sampling back to CONFIG
-        self.bus.write_i2c_block_data(self.i2c_address, self.reg_config, val)
+    def read_config(self):
+        return self.bus.read_i2c_block_data(self.i2c_address, self.reg_config, 1)[0]
 
-        # Read CONFIG to verify that we changed it
-        val = self.bus.read_i2c_block_data(self.i2c_address, self.reg_config, 2)
+    def convert(self):
+        """Runs a single conversion in one-shot mode and waits for it to finish."""
+        self.bus.write_i2c_block_data(self.i2c_address, self.reg_config, [self.config | self.config_os])
+        # Unlike the TMP102's, the TMP75's OS bit always reads back 0 so there's nothing to poll, wait out the slowest
+        # conversion the datasheet allows instead
+        sleep(self.max_conversion_time)
 
     # Calculate the 2's complement of a number
     @staticmethod
@@ -35,6 +79,8 @@ class TMP75:
 
     # Read temperature registers and calculate Celsius
     def read_temp(self):
+        if self.one_shot:
+            self.convert()
         # Read temperature registers
         val = self.bus.read_i2c_block_data(self.i2c_address, self.reg_temp, 2)
         # NOTE: val[0] = MSB byte 1, val [1] = LSB byte 2
@@ -0,0 +1,63 @@
+// Decoder for the backend's packed column format, see wire.py for the layout. Ask for it with
+// `Accept: application/vnd.thermos.columns` and hand the response's ArrayBuffer to decodeColumns. Float and byte
+// columns come back as typed arrays viewing the buffer, times as a Float64Array of epoch seconds.
+const WIRE_MEDIA_TYPE = 'application/vnd.thermos.columns';
+
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    const align = (offset) => offset + (-offset & 3);
+    if (String.fromCharCode(...bytes.subarray(0, 4)) !== 'TWF1') {
+        throw new Error('Not a packed column payload');
+    }
+    let offset = 4;
+    const metaLength = view.getUint32(offset, true);
+    offset += 4;
+    const result = JSON.parse(new TextDecoder().decode(bytes.subarray(offset, offset + metaLength)));
+    offset = align(offset + metaLength);
+
+    const n = view.getUint32(offset, true);
+    const count = view.getUint8(offset + 4);
+    offset += 5;
+    const columns = [];
+    for (let i = 0; i < count; i++) {
+        const nameLength = bytes[offset];
+        const name = String.fromCharCode(...bytes.subarray(offset + 1, offset + 1 + nameLength));
+        columns.push([name, bytes[offset + 1 + nameLength]]);
+        offset += nameLength + 2;
+    }
+    offset = align(offset);
+
+    for (const [name, kind] of columns) {
+        if (kind === 1) {
+            result[name] = new Float32Array(buffer, offset, n);
+            offset = align(offset + 4 * n);
+        } else if (kind === 2) {
+            // First time in milliseconds, then the deltas to each next one
+            const times = new Float64Array(n);
+            let ms = view.getFloat64(offset, true);
+            const deltas = new Int32Array(buffer, offset + 8, Math.max(n - 1, 0));
+            for (let i = 0; i < n; i++) {
+                if (i > 0) ms += deltas[i - 1];
+                times[i] = ms / 1000;
+            }
+            result[name] = times;
+            offset = align(offset + 8 + 4 * Math.max(n - 1, 0));
+        } else if (kind === 3) {
+            result[name] = new Uint8Array(buffer, offset, n);
+            offset = align(offset + n);
+        } else if (kind === 4) {
+            // Times in milliseconds, sent when a gap is too long for an int32 delta. Sections are only 4 byte
+            // aligned, so they're read one by one rather than through a Float64Array view
+            const times = new Float64Array(n);
+            for (let i = 0; i < n; i++) {
+                times[i] = view.getFloat64(offset + 8 * i, true) / 1000;
+            }
+            result[name] = times;
+            offset = align(offset + 8 * n);
+        } else {
+            throw new Error(`Unknown column kind ${kind}`);
+        }
+    }
+    return result;
+}
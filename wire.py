@@ -0,0 +1,110 @@
+"""
+Packed column format for history responses, an alternative to JSON for clients that ask for it with
+`Accept: application/vnd.thermos.columns`. wire.js decodes it in the browser.
+
+All numbers are little-endian and every section starts on a 4 byte boundary, so float columns can be viewed in place:
+
+    'TWF1'                                      magic
+    uint32 meta length, then that many bytes    UTF-8 JSON object of the scalar fields (cursor, resolution, ...)
+    uint32 n                                    number of points in every column
+    uint8 column count, then for each column    uint8 name length, name in ASCII, uint8 kind
+    the columns' data, in the same order:
+        FLOAT32     n float32
+        TIME        float64 first time in epoch milliseconds, then n - 1 int32 deltas in milliseconds
+        UINT8       n uint8
+        TIME_WIDE   n float64 epoch milliseconds, sent instead of TIME when a delta doesn't fit in an int32 (a gap
+                    of over 24.8 days, e.g. a range query across a summer the thermostat was off)
+"""
+import json
+import struct
+
+import numpy as np
+
+MEDIA_TYPE = 'application/vnd.thermos.columns'
+MAGIC = b'TWF1'
+
+FLOAT32 = 1
+TIME = 2
+UINT8 = 3
+TIME_WIDE = 4
+
+INT32 = np.iinfo(np.int32)
+
+
+def _pad(length):
+    return b'\0' * (-length % 4)
+
+
+def encode(columns, meta=None):
+    """columns is a list of (name, kind, values), all the same length. Times are epoch seconds."""
+    n = len(columns[0][2]) if columns else 0
+    for name, kind, values in columns:
+        if len(values) != n:
+            raise ValueError(f'Column {name} has {len(values)} values, expected {n}')
+    data = [_column(kind, values) for name, kind, values in columns]
+
+    meta = json.dumps(meta or {}, separators=(',', ':')).encode()
+    parts = [MAGIC, struct.pack('<I', len(meta)), meta, _pad(len(meta))]
+    parts.append(struct.pack('<IB', n, len(columns)))
+    for (name, _, _), (kind, _) in zip(columns, data):
+        parts.append(struct.pack('<B', len(name)) + name.encode('ascii') + struct.pack('<B', kind))
+    parts.append(_pad(sum(len(part) for part in parts)))
+    for _, column in data:
+        parts.append(column + _pad(len(column)))
+    return b''.join(parts)
+
+
+def _column(kind, values):
+    """The kind the column is sent as and its bytes."""
+    if kind == FLOAT32:
+        return kind, np.asarray(values, dtype='<f4').tobytes()
+    if kind == TIME:
+        # Deltas of the rounded values, so rounding errors don't add up along the column
+        ms = np.round(np.asarray(values, dtype=np.float64) * 1000).astype(np.int64)
+        deltas = np.diff(ms)
+        if len(deltas) and (deltas.min() < INT32.min or deltas.max() > INT32.max):
+            return TIME_WIDE, ms.astype('<f8').tobytes()
+        return kind, struct.pack('<d', float(ms[0]) if len(ms) else 0.0) + deltas.astype('<i4').tobytes()
+    if kind == UINT8:
+        return kind, np.asarray(values, dtype=np.uint8).tobytes()
+    raise ValueError(f'Unknown column kind {kind}')
+
+
+def decode(data):
+    """The inverse of encode, returns a dict of the meta fields and columns as numpy arrays, times in epoch seconds."""
+    if data[:4] != MAGIC:
+        raise ValueError('Not a packed column payload')
+    offset = 4
+    (meta_length,) = struct.unpack_from('<I', data, offset)
+    offset += 4
+    result = json.loads(data[offset:offset + meta_length])
+    offset += meta_length + len(_pad(meta_length))
+    n, count = struct.unpack_from('<IB', data, offset)
+    offset += 5
+    columns = []
+    for _ in range(count):
+        name_length = data[offset]
+        name = data[offset + 1:offset + 1 + name_length].decode('ascii')
+        columns.append((name, data[offset + 1 + name_length]))
+        offset += name_length + 2
+    offset += len(_pad(offset))
+
+    for name, kind in columns:
+        if kind == FLOAT32:
+            size = 4 * n
+            result[name] = np.frombuffer(data, dtype='<f4', count=n, offset=offset)
+        elif kind == TIME:
+            size = 8 + 4 * max(n - 1, 0)
+            (first,) = struct.unpack_from('<d', data, offset)
+            deltas = np.frombuffer(data, dtype='<i4', count=max(n - 1, 0), offset=offset + 8)
+            result[name] = (first + np.r_[0, np.cumsum(deltas, dtype=np.int64)][:n]) / 1000
+        elif kind == UINT8:
+            size = n
+            result[name] = np.frombuffer(data, dtype=np.uint8, count=n, offset=offset)
+        elif kind == TIME_WIDE:
+            size = 8 * n
+            result[name] = np.frombuffer(data, dtype='<f8', count=n, offset=offset) / 1000
+        else:
+            raise ValueError(f'Unknown column kind {kind}')
+        offset += size + len(_pad(size))
+    return result
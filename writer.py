@@ -0,0 +1,53 @@
+import logging
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """
+    Runs side work that doesn't need to happen on the control tick, like disk writes and logging, on its own
+    thread. Jobs run in the order submitted. Until start() is called they run inline, which keeps single threaded users
+    like the simulator deterministic.
+    """
+
+    def __init__(self, max_queue=1024):
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self.dropped = 0  # jobs thrown away because the queue was full
+        self.errors = 0
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def submit(self, job, *args, **kwargs):
+        if self._thread is None:
+            job(*args, **kwargs)
+            return
+        try:
+            self._queue.put_nowait((job, args, kwargs))
+        except queue.Full:
+            # Something is badly stuck, losing a write beats blocking the control loop
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='background-writer', daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """Blocks until everything submitted so far has run."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            job, args, kwargs = self._queue.get()
+            try:
+                job(*args, **kwargs)
+            except Exception as e:
+                self.errors += 1
+                log.error('Background write failed (%d total): %s', self.errors, e, extra={'event': 'write_failed'})
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+
+from clock import SystemClock
+from controller import TemperatureController, TemperatureSchedule
+from hardware import make_sensor
+from hysteresis import HysteresisController
+from metrics import Registry
+from on_off_controller import OnOffController
+from pid import PIDController
+from sampler import SamplerGroup
+from ticker import Ticker
+from writer import BackgroundWriter
+
+log = logging.getLogger(__name__)
+
+CONTROLLERS = {
+    'hysteresis': HysteresisController,
+    'onoff': OnOffController,
+    'pid': PIDController,
+}
+
+# Keys of a zone entry that describe the zone itself, everything else is passed to the controller
+ZONE_KEYS = {'id', 'name', 'controller', 'sensor', 'address', 'resolution', 'one_shot', 'filter', 'schedule'}
+
+
+class Zones:
+    """
+    Several controllers, each with its own sensor, relay and schedule, run from one process. They share a single
+    Ticker, a single pass over the sensors per period and a single background writer, so adding a zone adds work to
+    the existing threads rather than new ones.
+    """
+
+    def __init__(self, controllers: dict[str, TemperatureController], default=None, names=None, update_time=2,
+                 clock=None, missed_ticks='skip'):
+        if not controllers:
+            raise ValueError('At least one zone is needed')
+        self.controllers = dict(controllers)
+        self.default = default or next(iter(self.controllers))
+        if self.default not in self.controllers:
+            raise ValueError(f'Default zone {self.default!r} is not one of {sorted(self.controllers)}')
+        self.names = {zone: (names or {}).get(zone, zone) for zone in self.controllers}
+        self._failing = {}  # zone -> repr of the error its last tick failed with
+        self.ticker = Ticker(update_time, clock=clock or SystemClock(), policy=missed_ticks)
+        self.writer = BackgroundWriter()
+        self.sampler = SamplerGroup([controller.sampler for controller in self], period=update_time)
+        for controller in self:
+            # Nothing has been queued on the controllers' own writers yet, they ran everything inline so far
+            controller.ticker = self.ticker
+            controller.writer = self.writer
+
+    @classmethod
+    def from_file(cls, path, **defaults):
+        """
+        Builds the zones described in a JSON file. defaults are controller arguments used for any zone that doesn't set
+        them, plus update_time and missed_ticks which apply to all zones, and sensor and sensor_options, the driver
+        and its make_sensor arguments for zones that don't set their own.
+        """
+        config = json.load(open(path))
+        update_time = config.get('update_time', defaults.pop('update_time', 2))
+        missed_ticks = config.get('missed_ticks', defaults.pop('missed_ticks', 'skip'))
+        sensor_driver = defaults.pop('sensor', 'tmp75')
+        sensor_options = defaults.pop('sensor_options', {})
+
+        controllers, names = {}, {}
+        for entry in config['zones']:
+            zone = str(entry['id'])
+            if zone in controllers:
+                raise ValueError(f'Zone {zone!r} is defined twice in {path}')
+            kwargs = {**defaults, **{key: value for key, value in entry.items() if key not in ZONE_KEYS}}
+            kwargs.setdefault('data_file', f'history-{zone}.dat')
+            kwargs.setdefault('journal_file', f'transitions-{zone}.dat')
+            kwargs.setdefault('config_file', None)
+            kwargs['update_time'] = update_time
+
+            sensor_kwargs = {**sensor_options, **{key: entry[key] for key in ('resolution', 'one_shot', 'filter')
+                                                  if key in entry}}
+            if 'address' in entry:
+                address = entry['address']
+                sensor_kwargs['address'] = int(address, 0) if isinstance(address, str) else address
+            kwargs['sensor'] = make_sensor(entry.get('sensor', sensor_driver), **sensor_kwargs)
+
+            schedule = TemperatureSchedule()
+            if 'schedule' in entry:
+                schedule.from_dict(entry['schedule'])
+            kwargs['schedule'] = schedule
+
+            log.info('Setting up zone %s', zone, extra={'event': 'startup'})
+            controllers[zone] = CONTROLLERS[entry.get('controller', 'hysteresis')](**kwargs)
+            names[zone] = entry.get('name', zone)
+        return cls(controllers, default=config.get('default'), names=names, update_time=update_time,
+                   missed_ticks=missed_ticks)
+
+    def __len__(self):
+        return len(self.controllers)
+
+    def __iter__(self):
+        return iter(self.controllers.values())
+
+    def __contains__(self, zone):
+        return zone in self.controllers
+
+    def __getitem__(self, zone) -> TemperatureController:
+        return self.controllers[zone]
+
+    def start(self):
+        """Everything the control loop needs running before the first tick."""
+        for controller in self:
+            controller.restore_rollups()
+        self.sampler.start()
+        self.writer.start()
+
+    def control_loop(self):
+        self.start()
+        self.ticker.run(self.tick)
+
+    async def control_task(self):
+        """control_loop for an asyncio event loop, the ticks run on the loop between requests."""
+        await asyncio.get_running_loop().run_in_executor(None, self.start)
+        await self.ticker.run_async(self.tick)
+
+    def tick(self):
+        for zone, controller in self.controllers.items():
+            # One zone failing must not stop the others from being controlled
+            try:
+                controller.tick()
+            except Exception as e:
+                self._tick_failed(zone, controller, e)
+            else:
+                if self._failing.pop(zone, None) is not None:
+                    log.warning('Zone %s recovered', zone, extra={'event': 'tick_recovered'})
+
+    def _tick_failed(self, zone, controller, error):
+        # A zone that can't be controlled fails safe with its heater off, like on a stale reading
+        try:
+            if controller.is_heater_on():
+                log.warning('Zone %s turning heater off.', zone, extra={'event': 'tick_failed'})
+                controller.turn_off_heater()
+        except Exception as e:
+            log.error('Zone %s could not turn its heater off: %r', zone, e, extra={'event': 'tick_failed'})
+        # The trace is logged once per error rather than on every tick, so it doesn't flush the log ring
+        if self._failing.get(zone) != repr(error):
+            self._failing[zone] = repr(error)
+            log.error('Zone %s tick failed: %r', zone, error, exc_info=error, extra={'event': 'tick_failed'})
+
+    def get_state(self):
+        return {
+            zone: {'name': self.names[zone], 'default': zone == self.default, **controller.get_state()}
+            for zone, controller in self.controllers.items()
+        }
+
+    def register_metrics(self, registry: Registry):
+        def per_zone(value):
+            return lambda: [({'zone': zone}, value(controller)) for zone, controller in self.controllers.items()]
+
+        def latest_temperature(controller):
+            reading = controller.latest_reading()
+            return reading.value if reading is not None else None
+
+        stats = self.ticker.stats
+        registry.histogram('thermos_i2c_read_seconds', 'Time taken by one sensor read.',
+                           per_zone(lambda controller: controller.sampler.read_seconds))
+        registry.counter('thermos_sensor_read_errors_total', 'Sensor reads that failed.',
+                         per_zone(lambda controller: controller.sampler.errors))
+        registry.histogram('thermos_tick_duration_seconds', 'Time taken by one control tick, all zones.',
+                           lambda: [({}, stats.duration_seconds)])
+        registry.histogram('thermos_tick_jitter_seconds', 'How late control ticks started after their deadline.',
+                           lambda: [({}, stats.jitter_seconds)])
+        registry.counter('thermos_tick_overruns_total', 'Control ticks that ran past the next deadline.',
+                         lambda: [({}, stats.overruns)])
+        registry.counter('thermos_ticks_skipped_total', 'Control tick deadlines dropped without a tick.',
+                         lambda: [({}, stats.skipped)])
+        registry.counter('thermos_relay_transitions_total', 'Times the heater relay switched.',
+                         per_zone(lambda controller: controller.relay_transitions))
+        registry.counter('thermos_heater_on_seconds_total', 'Time the heater has been on.',
+                         per_zone(lambda controller: controller.heater_on_seconds()))
+        registry.gauge('thermos_heater_on', 'Whether the heater is on.',
+                       per_zone(lambda controller: controller.heater_state()))
+        registry.gauge('thermos_temperature_celsius', 'Latest temperature reading.', per_zone(latest_temperature))
+        registry.gauge('thermos_setpoint_celsius', 'Current setpoint.', per_zone(lambda controller: controller.setpoint))
+        registry.gauge('thermos_history_samples', 'Samples held in the in-memory history buffer.',
+                       per_zone(lambda controller: len(controller.history)))
+        registry.gauge('thermos_history_capacity', 'Capacity of the in-memory history buffer.',
+                       per_zone(lambda controller: controller.history.capacity))
+        registry.gauge('thermos_event_subscribers', 'Open event streams.',
+                       per_zone(lambda controller: len(controller.events)))
+        registry.gauge('thermos_writer_queue', 'Writes waiting on the background writer.',
+                       lambda: [({}, len(self.writer))])
+        registry.counter('thermos_writer_dropped_total', 'Writes dropped because the background writer fell behind.',
+                         lambda: [({}, self.writer.dropped)])